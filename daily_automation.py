@@ -1,21 +1,35 @@
 import datetime
 import zipfile
+import zlib
 import io
 import os
-import gc
+import threading
+import tempfile
+import shutil
+import xml.etree.ElementTree as ET
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
 import numpy as np
 import openpyxl 
-from openpyxl.utils.dataframe import dataframe_to_rows 
 import xlsxwriter 
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
 
 # Google API Libraries
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
 import google.auth
+from google.auth.transport.requests import Request
+
+# Optional: ISA-L's SIMD inflate for the zipped main report (stdlib zlib is used without it)
+try:
+    from isal import isal_zlib
+except ImportError:
+    isal_zlib = None
 
 # --- LOGGING UTILITY ---
 
@@ -28,127 +42,300 @@ def log(message):
 SERVICE_ACCOUNT_FILE = 'credentials.json' 
 SCOPES = ['https://www.googleapis.com/auth/drive']
 
+# Shared-drive flags for every Drive call (listing calls also need includeItemsFromAllDrives)
+ALL_DRIVES = {'supportsAllDrives': True}
+ALL_DRIVES_LIST = {'supportsAllDrives': True, 'includeItemsFromAllDrives': True}
+
 # Folder IDs
 SOURCE_FOLDER_ID = '1sern1xXqdDrQQBLXxbANj7LPs3IE1Dzo'
 TARGET_FOLDER_ID = '1HTkBss1orVVn1akNygxiuklaAHQnJy8w'
 FILE_PREFIXES = ['ArticleSalesReport', 'Overall_Instock']
 
+# Only these columns of the lookup files are used by the transformation pipeline
+YTD_SALES_COLS = ['2021 YTD Sales', '2022 YTD Sales', '2023 YTD Sales', '2024 YTD Sales', '2025 YTD Sales']
+HELPER_COLUMNS = {
+    'hirarchy.csv': ['Location', 'Market Manager', 'Region', 'Market'],
+    'division_group.csv': ['Sub Division', 'Sub Division_V1'],
+    'gst_change_list.csv': ['UID'],
+    'ytd_sales.csv': ['Article UID'] + YTD_SALES_COLS,
+}
+
+# Rows of the article report transformed at a time (bounds the join/metric temporaries)
+ARTICLE_CHUNK_ROWS = 500_000
+
+# Main-file downloads stay in RAM up to this size, then spill to a temp file
+SPOOL_MAX_BYTES = 64 * 1024 * 1024
+# Bytes fetched per HTTP round trip (the library default is 100 KiB)
+DOWNLOAD_CHUNK_SIZE = 32 * 1024 * 1024
+# Uploads below RESUMABLE_MIN_BYTES go in one multipart request; larger ones in 16 MiB chunks
+UPLOAD_CHUNK_SIZE = 16 * 1024 * 1024
+RESUMABLE_MIN_BYTES = 5 * 1024 * 1024
+
+_credentials = None
+_credentials_lock = threading.Lock()
+
+def get_credentials():
+    """Loads the service-account credentials once and fetches the token up front for all services/threads."""
+    global _credentials
+    with _credentials_lock:
+        if _credentials is None:
+            creds, _ = google.auth.default(scopes=SCOPES)
+            creds.refresh(Request())
+            _credentials = creds
+    return _credentials
+
 def authenticate():
     """Authenticates using the Service Account and returns the Drive Service."""
     log("Attempting Google Drive authentication...")
     try:
-        creds, _ = google.auth.default(scopes=SCOPES)
-        drive_service = build('drive', 'v3', credentials=creds)
+        drive_service = build('drive', 'v3', credentials=get_credentials(), static_discovery=True, cache_discovery=False)
         log("✅ Google Drive authentication successful.")
         return drive_service
     except Exception as e:
         log(f"❌ ERROR: Authentication failed. Details: {e}")
         return None
 
+_thread_local = threading.local()
+
+def get_thread_drive_service():
+    """Returns a Drive service owned by the calling thread (httplib2 is not thread-safe)."""
+    if not hasattr(_thread_local, 'drive_service'):
+        _thread_local.drive_service = build('drive', 'v3', credentials=get_credentials(), static_discovery=True, cache_discovery=False)
+    return _thread_local.drive_service
+
+def run_with_thread_service(func, *args):
+    """Runs a Drive helper on a worker thread using that thread's own service."""
+    return func(get_thread_drive_service(), *args)
+
 # ==============================================================================
 # SECTION 1: HELPER FUNCTIONS (DOWNLOAD / UPLOAD)
 # ==============================================================================
 
-def download_csv_to_df(drive_service, file_name, folder_id):
-    """Finds a CSV helper file by name and loads it into a Pandas DataFrame."""
-    log(f"  Downloading helper file: {file_name}...")
+def enable_fast_unzip():
+    """Routes zipfile's DEFLATE reads through ISA-L when the isal package is installed."""
+    if isal_zlib is None: return
+    stdlib_decompressor = zipfile._get_decompressor
+
+    def get_decompressor(compress_type):
+        if compress_type == zipfile.ZIP_DEFLATED:
+            return isal_zlib.decompressobj(-zlib.MAX_WBITS)
+        return stdlib_decompressor(compress_type)
+
+    # Only reads are patched; xlsxwriter/openpyxl still compress through stdlib zlib
+    zipfile._get_decompressor = get_decompressor
+    log("  Using ISA-L for zip decompression.")
+
+def read_csv_fast(source, encoding='utf8', usecols=None, keep_arrow=False):
+    """
+    Parses a CSV with pyarrow's multithreaded reader, falling back to the pandas C parser.
+    `usecols` restricts parsing to the listed columns; names missing from the file are skipped.
+    `keep_arrow` returns the pyarrow Table itself so a large file can be converted in slices.
+    """
     try:
-        query = f"'{folder_id}' in parents and name='{file_name}' and trashed=false"
+        # Peek at the first block: columns pyarrow would turn into dates are kept as text, exactly like
+        # pd.read_csv does, and only requested names absent from the file are dropped later
+        with pacsv.open_csv(source, read_options=pacsv.ReadOptions(encoding=encoding)) as reader:
+            column_types = {f.name: pa.string() for f in reader.schema if pa.types.is_temporal(f.type)}
+            missing = [c for c in usecols or [] if c not in reader.schema.names]
+        source.seek(0)
+        table = pacsv.read_csv(
+            source,
+            read_options=pacsv.ReadOptions(encoding=encoding),
+            convert_options=pacsv.ConvertOptions(
+                strings_can_be_null=True, column_types=column_types,
+                include_columns=usecols or [], include_missing_columns=True
+            )
+        )
+    except pa.ArrowInvalid as e:
+        # pyarrow rejects some quoting edge cases the C parser tolerates
+        log(f"    [INFO] pyarrow could not parse the file ({e}), using default parser.")
+        source.seek(0)
+        return pd.read_csv(
+            source, encoding=encoding, low_memory=False,
+            usecols=(lambda c: c in usecols) if usecols else None
+        )
+
+    # Requested columns that are absent from the file come back as all-null placeholders
+    table = table.drop_columns(missing)
+
+    for i, field in enumerate(table.schema):
+        if pa.types.is_null(field.type):
+            # A column that is blank throughout is float64 NaN with pd.read_csv
+            table = table.set_column(i, field.name, table.column(i).cast(pa.float64()))
+        if pa.types.is_binary(field.type):
+            # pyarrow falls back to raw bytes instead of raising on bad text
+            raise UnicodeDecodeError(encoding, b'', 0, 1, f"column '{field.name}' is not valid {encoding}")
+    return table if keep_arrow else table.to_pandas()
+
+def list_folder_files(drive_service, folder_id):
+    """Maps every file name in a folder to its id with one paginated listing. Returns {name: id}."""
+    file_ids = {}
+    page_token = None
+    while True:
         results = drive_service.files().list(
-            q=query, fields="files(id, name)", supportsAllDrives=True, includeItemsFromAllDrives=True
+            q=f"'{folder_id}' in parents and trashed=false", fields="nextPageToken, files(id, name)",
+            pageSize=1000, pageToken=page_token, **ALL_DRIVES_LIST
         ).execute()
-        items = results.get('files', [])
-        
-        if not items:
+        for item in results.get('files', []):
+            file_ids.setdefault(item['name'], item['id'])
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return file_ids
+
+def download_csv_to_df(drive_service, file_name, file_id, usecols=None):
+    """Downloads a CSV helper file (already located by ID) into a Pandas DataFrame."""
+    log(f"  Downloading helper file: {file_name}...")
+    try:
+        if not file_id:
             log(f"  [ERROR] Helper file '{file_name}' not found.")
             return None
             
-        request = drive_service.files().get_media(fileId=items[0]['id'], supportsAllDrives=True)
+        request = drive_service.files().get_media(fileId=file_id, **ALL_DRIVES)
         file_buffer = BytesIO()
-        downloader = MediaIoBaseDownload(file_buffer, request)
+        downloader = MediaIoBaseDownload(file_buffer, request, chunksize=DOWNLOAD_CHUNK_SIZE)
         
         done = False
         while not done: _, done = downloader.next_chunk()
         
         file_buffer.seek(0)
         try:
-            return pd.read_csv(file_buffer)
+            return read_csv_fast(file_buffer, usecols=usecols)
         except UnicodeDecodeError:
             file_buffer.seek(0)
             log(f"  [INFO] Reading '{file_name}' with latin1 encoding.")
-            return pd.read_csv(file_buffer, encoding='latin1')
+            return read_csv_fast(file_buffer, encoding='latin1', usecols=usecols)
 
     except Exception as e:
         log(f"  [ERROR] Failed to download '{file_name}': {e}")
         return None
 
-def load_file_to_df(drive_service, file_id, file_name):
-    """Downloads a generic file (CSV or ZIP containing CSV) into a DataFrame."""
+def make_upload_media(buffer, mimetype):
+    """Wraps a binary buffer for upload, picking simple or chunked resumable upload by size."""
+    start = buffer.tell()
+    size = buffer.seek(0, io.SEEK_END) - start
+    buffer.seek(start)
+    return MediaIoBaseUpload(
+        buffer, mimetype=mimetype, chunksize=UPLOAD_CHUNK_SIZE, resumable=size >= RESUMABLE_MIN_BYTES
+    )
+
+def load_file_to_df(drive_service, file_id, file_name, keep_arrow=False):
+    """Downloads a generic file (CSV or ZIP containing CSV) into a DataFrame (or pyarrow Table, see read_csv_fast)."""
     log(f"  Loading main file: {file_name} (ID: {file_id})...")
     try:
-        request = drive_service.files().get_media(fileId=file_id, supportsAllDrives=True)
-        file_buffer = BytesIO()
-        downloader = MediaIoBaseDownload(file_buffer, request)
-        
-        done = False
-        while not done: _, done = downloader.next_chunk()
-        file_buffer.seek(0)
+        if not (file_name.endswith('.zip') or file_name.endswith('.csv')):
+            log(f"    [ERROR] Unsupported file format: {file_name}")
+            return None
+
+        request = drive_service.files().get_media(fileId=file_id, **ALL_DRIVES)
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as file_buffer:
+            downloader = MediaIoBaseDownload(file_buffer, request, chunksize=DOWNLOAD_CHUNK_SIZE)
+
+            done = False
+            while not done: _, done = downloader.next_chunk()
+            file_buffer.seek(0)
+
+            if file_name.endswith('.csv'):
+                try:
+                    return read_csv_fast(file_buffer, keep_arrow=keep_arrow)
+                except UnicodeDecodeError:
+                    file_buffer.seek(0)
+                    return read_csv_fast(file_buffer, encoding='latin1', keep_arrow=keep_arrow)
 
-        csv_bytes = None
-        if file_name.endswith('.zip'):
             log(f"    > Unzipping {file_name}...")
             with zipfile.ZipFile(file_buffer, 'r') as zf:
                 csv_names = [n for n in zf.namelist() if n.endswith('.csv') and not n.startswith('__MACOSX')]
                 if not csv_names:
                     log("    [ERROR] No CSV found inside zip.")
                     return None
-                csv_bytes = zf.read(csv_names[0])
-        elif file_name.endswith('.csv'):
-            csv_bytes = file_buffer.read()
-        else:
-            log(f"    [ERROR] Unsupported file format: {file_name}")
-            return None
-
-        if csv_bytes:
-            try:
-                # Read everything as string initially to prevent auto-conversion errors
-                return pd.read_csv(BytesIO(csv_bytes), low_memory=False)
-            except UnicodeDecodeError:
-                return pd.read_csv(BytesIO(csv_bytes), encoding='latin1', low_memory=False)
-        return None
+                # Parse straight from the decompressing stream instead of extracting to bytes first
+                try:
+                    with zf.open(csv_names[0]) as csv_stream:
+                        return read_csv_fast(csv_stream, keep_arrow=keep_arrow)
+                except UnicodeDecodeError:
+                    with zf.open(csv_names[0]) as csv_stream:
+                        return read_csv_fast(csv_stream, encoding='latin1', keep_arrow=keep_arrow)
 
     except Exception as e:
         log(f"  [ERROR] Failed to load main file: {e}")
         return None
 
-def upload_excel_report(drive_service, excel_buffer, file_name, folder_id):
-    """Uploads the generated Excel Report (with graphs) to Drive."""
+def upload_excel_report(drive_service, excel_buffer, file_name, folder_id, folder_files):
+    """Uploads the generated Excel Report (with graphs) to Drive. `folder_files` is the folder's {name: id} map."""
     log(f"  Upload: {file_name}...")
     try:
-        query = f"'{folder_id}' in parents and name='{file_name}' and trashed=false"
-        results = drive_service.files().list(q=query, fields="files(id)").execute()
-        existing_files = results.get('files', [])
-
         file_metadata = {'name': file_name, 'parents': [folder_id]}
-        media = MediaIoBaseUpload(
+        media = make_upload_media(
             excel_buffer, 
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 
-            resumable=True
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
         )
         
-        if existing_files:
-            file_id = existing_files[0]['id']
-            drive_service.files().update(fileId=file_id, media_body=media, supportsAllDrives=True).execute()
+        if file_name in folder_files:
+            drive_service.files().update(fileId=folder_files[file_name], media_body=media, **ALL_DRIVES).execute()
         else:
-            drive_service.files().create(body=file_metadata, media_body=media, fields='id', supportsAllDrives=True).execute()
+            created = drive_service.files().create(body=file_metadata, media_body=media, fields='id', **ALL_DRIVES).execute()
+            folder_files[file_name] = created['id']
             
         log(f"  ✅ Advanced Excel Report uploaded successfully.")
     except Exception as e:
         log(f"  ❌ Failed to upload report: {e}")
 
-def update_xlsm_data_sheet(drive_service, df_to_paste, file_name_to_find, sheet_name_to_update, folder_id):
+def write_data_sheet_xlsx(df):
+    """
+    Streams a DataFrame into a throwaway xlsx with xlsxwriter's constant_memory mode.
+    The data lands on the second sheet so it is never the selected tab; strings are inline,
+    so the sheet XML does not depend on any other part of the workbook.
     """
-    Updates the raw data sheet in the macro-enabled .xlsm file.
+    buf = BytesIO()
+    wb = xlsxwriter.Workbook(buf, {'constant_memory': True, 'strings_to_urls': False})
+    wb.add_worksheet('Welcome')
+    ws = wb.add_worksheet('Data')
+    ws.write_row(0, 0, list(df.columns))
+
+    # Plain Python values per column, with NaN/NaT as None (left blank, like openpyxl did)
+    columns = []
+    for col in df.columns:
+        values = df[col].to_numpy(dtype=object)
+        values[df[col].isna().to_numpy()] = None
+        columns.append(values)
+    for r, row in enumerate(zip(*columns), start=1):
+        ws.write_row(r, 0, row)
+
+    wb.close()
+    buf.seek(0)
+    return buf
+
+def replace_sheet_part(workbook_buffer, sheet_name, source_buffer, source_part='xl/worksheets/sheet2.xml'):
+    """Returns a copy of the workbook zip with the named sheet's XML swapped for `source_part` of another xlsx."""
+    ns = {
+        'm': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main',
+        'rel': 'http://schemas.openxmlformats.org/package/2006/relationships',
+    }
+    rid_attr = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id'
+
+    out = BytesIO()
+    with zipfile.ZipFile(workbook_buffer) as src, zipfile.ZipFile(source_buffer) as data, \
+            zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as dst:
+        # Resolve the sheet name to its part path through workbook.xml and its rels
+        sheets = ET.fromstring(src.read('xl/workbook.xml')).find('m:sheets', ns)
+        rid = next(sh.get(rid_attr) for sh in sheets if sh.get('name') == sheet_name)
+        rels = ET.fromstring(src.read('xl/_rels/workbook.xml.rels'))
+        target = next(r.get('Target') for r in rels.findall('rel:Relationship', ns) if r.get('Id') == rid)
+        part = target.lstrip('/') if target.startswith('/') else 'xl/' + target
+
+        for item in src.infolist():
+            if item.filename == part:
+                info = zipfile.ZipInfo(part, item.date_time)
+                info.compress_type = zipfile.ZIP_DEFLATED  # a bare ZipInfo would be stored uncompressed
+                with data.open(source_part) as fin, dst.open(info, 'w') as fout:
+                    shutil.copyfileobj(fin, fout, 1024 * 1024)
+            else:
+                dst.writestr(item, src.read(item.filename))
+    out.seek(0)
+    return out
+
+def update_xlsm_data_sheet(drive_service, df_to_paste, file_name_to_find, sheet_name_to_update, folder_files):
+    """
+    Updates the raw data sheet in the macro-enabled .xlsm file (looked up in the folder's {name: id} map).
     CRITICAL SECURITY: Sets the data sheet to 'veryHidden' so users cannot see data
     unless they log in via the VBA Macro.
     """
@@ -157,17 +344,14 @@ def update_xlsm_data_sheet(drive_service, df_to_paste, file_name_to_find, sheet_
 
     try:
         # 1. Download the existing XLSM file
-        query = f"'{folder_id}' in parents and name='{file_name_to_find}' and trashed=false"
-        results = drive_service.files().list(q=query, fields="files(id, name)", supportsAllDrives=True, includeItemsFromAllDrives=True).execute()
-        items = results.get('files', [])
-        if not items:
+        file_id = folder_files.get(file_name_to_find)
+        if not file_id:
             log(f"  [ERROR] {file_name_to_find} not found.")
             return
         
-        file_id = items[0]['id']
-        request = drive_service.files().get_media(fileId=file_id, supportsAllDrives=True)
+        request = drive_service.files().get_media(fileId=file_id, **ALL_DRIVES)
         buffer = BytesIO()
-        downloader = MediaIoBaseDownload(buffer, request)
+        downloader = MediaIoBaseDownload(buffer, request, chunksize=DOWNLOAD_CHUNK_SIZE)
         done = False
         while not done: _, done = downloader.next_chunk()
         buffer.seek(0)
@@ -184,7 +368,7 @@ def update_xlsm_data_sheet(drive_service, df_to_paste, file_name_to_find, sheet_
             # Ensure it is visible if it already exists
             wb['Welcome'].sheet_state = 'visible'
 
-        # 4. Update the Data Sheet
+        # 4. Recreate the Data Sheet as an empty placeholder
         if sheet_name_to_update in wb.sheetnames:
             idx = wb.sheetnames.index(sheet_name_to_update)
             wb.remove(wb[sheet_name_to_update])
@@ -192,37 +376,37 @@ def update_xlsm_data_sheet(drive_service, df_to_paste, file_name_to_find, sheet_
         else:
             ws = wb.create_sheet(sheet_name_to_update)
             
-        # Write Data
-        for r in dataframe_to_rows(df_to_paste, index=False, header=True):
-            ws.append(r)
-            
         # 5. LOCK THE DATA SHEET (veryHidden) 
         ws.sheet_state = 'veryHidden' 
             
-        # 6. Save and Upload
-        out_buffer = BytesIO()
-        wb.save(out_buffer)
-        out_buffer.seek(0)
+        # 6. Save, then splice in the data rows streamed by xlsxwriter
+        #    (openpyxl would hold every cell of the report as a Python object)
+        shell_buffer = BytesIO()
+        wb.save(shell_buffer)
         wb.close()
+        shell_buffer.seek(0)
+        out_buffer = replace_sheet_part(shell_buffer, sheet_name_to_update, write_data_sheet_xlsx(df_to_paste))
         
-        media = MediaIoBaseUpload(out_buffer, mimetype='application/vnd.ms-excel.sheet.macroEnabled.12', resumable=True)
-        drive_service.files().update(fileId=file_id, media_body=media, supportsAllDrives=True).execute()
+        media = make_upload_media(out_buffer, mimetype='application/vnd.ms-excel.sheet.macroEnabled.12')
+        drive_service.files().update(fileId=file_id, media_body=media, **ALL_DRIVES).execute()
         log("  ✅ XLSM updated and LOCKED successfully.")
 
     except Exception as e:
         log(f"  [ERROR] Updating XLSM failed: {e}")
 
-def upload_df_as_csv(drive_service, df, file_name, folder_id):
-    """Simple helper to upload a DataFrame as a CSV."""
+def upload_df_as_csv(drive_service, df, file_name, folder_id, folder_files):
+    """Simple helper to upload a DataFrame as a CSV. Records the new file in the folder's {name: id} map."""
     if df is None: return
     try:
-        buffer = io.StringIO()
-        df.to_csv(buffer, index=False)
+        # Encode straight into the upload buffer instead of building the text first and copying it
+        buffer = BytesIO()
+        df.to_csv(buffer, index=False, encoding='utf-8')
         buffer.seek(0)
-        media = MediaIoBaseUpload(BytesIO(buffer.getvalue().encode('utf-8')), mimetype='text/csv', resumable=True)
+        media = make_upload_media(buffer, mimetype='text/csv')
         
         file_metadata = {'name': file_name, 'parents': [folder_id]}
-        drive_service.files().create(body=file_metadata, media_body=media, supportsAllDrives=True).execute()
+        created = drive_service.files().create(body=file_metadata, media_body=media, fields='id', **ALL_DRIVES).execute()
+        folder_files.setdefault(file_name, created['id'])
         log(f"  ✅ CSV Uploaded: {file_name}")
     except Exception as e:
         log(f"  [ERROR] CSV Upload failed: {e}")
@@ -231,12 +415,69 @@ def upload_df_as_csv(drive_service, df, file_name, folder_id):
 # SECTION 2: DATA TRANSFORMATION LOGIC
 # ==============================================================================
 
+# Powers of ten used to count the digits of an int64 ID (10**18 is the largest that fits)
+POW10 = 10 ** np.arange(1, 19, dtype=np.int64)
+
+def to_int64(series, fill=0):
+    """Parses an ID column to int64, replacing blanks and junk with `fill`."""
+    try:
+        values = pa.array(series, from_pandas=True)
+        if pa.types.is_floating(values.type):
+            # Float columns truncate like astype('int64')
+            values = pc.cast(pc.fill_null(values, float(fill)), pa.int64(), safe=False)
+        else:
+            # Integer columns and clean integer text cast exactly, without a float round trip
+            values = pc.fill_null(pc.cast(values, pa.int64()), fill)
+        return pd.Series(values.to_numpy(), index=series.index)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+        # Text with blanks or junk: let pandas coerce the bad entries
+        return pd.to_numeric(series, errors='coerce').fillna(fill).astype('int64')
+
+def concat_key(left, right):
+    """
+    Integer equivalent of str(left) + str(right) for two int64 ID columns.
+    The UIDs in ytd_sales / gst_change_list were built by string concatenation,
+    so the shift depends on the digit count of `right` rather than a fixed offset.
+    A missing `left` (0) gets a negative key so it can never collide with a real UID.
+    """
+    index, left, right = left.index, left.to_numpy(), right.to_numpy()
+    digits = np.searchsorted(POW10, np.abs(right), side='right') + 1
+    return pd.Series(np.where(left == 0, -right - 1, left * (10 ** digits) + right), index=index)
+
+def as_float64(series):
+    """Parses a numeric column into a float64 NumPy array, with blanks and junk as NaN."""
+    return pd.to_numeric(series, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+
+def sales_block(df, cols):
+    """Returns the given sales columns as one float64 matrix, with blanks and junk as NaN."""
+    try:
+        return df[cols].to_numpy(dtype=np.float64, na_value=np.nan)
+    except (ValueError, TypeError):
+        # Mixed text/number columns: coerce each column, then stack
+        return np.column_stack([as_float64(df[c]) for c in cols])
+
+def compact_lookup(df, category_cols=()):
+    """Shrinks a lookup frame before joining: repeated labels to category (value columns keep full precision)."""
+    if df is None: return None
+    for col in category_cols:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df
+
+def category_mask(series, predicate):
+    """Evaluates a text predicate once per distinct value and broadcasts it through the category codes."""
+    cat = series.astype('category')
+    keep = np.array([predicate(str(c)) for c in cat.cat.categories], dtype=bool)
+    codes = cat.cat.codes.to_numpy()
+    # Code -1 marks missing values, which astype(str) used to render as 'nan'
+    return np.where(codes >= 0, keep[codes], predicate('nan'))
+
 def process_overall_instock(df):
     """Adds primary keys to Instock Report."""
     if df is None: return None
     try:
         if 'Store Nbr' in df.columns and 'Old Nbr' in df.columns:
-            df.insert(0, 'key', df['Store Nbr'].astype(str) + df['Old Nbr'].astype(str))
+            df.insert(0, 'key', concat_key(to_int64(df['Store Nbr']), to_int64(df['Old Nbr'])))
         return df
     except Exception as e:
         log(f"  [ERROR] Instock processing failed: {e}")
@@ -253,9 +494,7 @@ def process_lmtd_logic(df_lmtd, calc_date):
     try:
         # Ensure Key Columns Exist
         if 'STORE_NBR' in df_lmtd.columns and 'ITEM_NUMBER' in df_lmtd.columns:
-            s_store = pd.to_numeric(df_lmtd['STORE_NBR'], errors='coerce').fillna(0).astype('int64').astype(str)
-            s_item = pd.to_numeric(df_lmtd['ITEM_NUMBER'], errors='coerce').fillna(0).astype('int64').astype(str)
-            df_lmtd['LMTD_Key'] = s_store + s_item
+            df_lmtd['LMTD_Key'] = concat_key(to_int64(df_lmtd['STORE_NBR']), to_int64(df_lmtd['ITEM_NUMBER']))
         else:
             log("    [ERROR] STORE_NBR or ITEM_NUMBER missing in LMTD file.")
             return None
@@ -270,17 +509,21 @@ def process_lmtd_logic(df_lmtd, calc_date):
             if col_name in df_lmtd.columns:
                 cols_lmtd.append(col_name)
         
+        # One float64 block for the whole month; the to-date sum is a column slice of it
+        cols_lm = [c for c in df_lmtd.columns if c.startswith('Sales_Mar_')]
+        block = sales_block(df_lmtd, cols_lm) if cols_lm else None
+
         if not cols_lmtd:
             df_lmtd['LMTD Sales'] = 0
         else:
-            df_lmtd['LMTD Sales'] = df_lmtd[cols_lmtd].apply(pd.to_numeric, errors='coerce').sum(axis=1)
+            pos = [cols_lm.index(c) for c in cols_lmtd]
+            df_lmtd['LMTD Sales'] = np.nansum(block[:, pos], axis=1)
 
         # 2. Calculate LM Sales (Total Mar Sales)
-        cols_lm = [c for c in df_lmtd.columns if c.startswith('Sales_Mar_')] # <--- UPDATED
         if not cols_lm:
             df_lmtd['LM Sales'] = 0
         else:
-            df_lmtd['LM Sales'] = df_lmtd[cols_lm].apply(pd.to_numeric, errors='coerce').sum(axis=1)
+            df_lmtd['LM Sales'] = np.nansum(block, axis=1)
 
         return df_lmtd[['LMTD_Key', 'LMTD Sales', 'LM Sales']]
 
@@ -298,9 +541,7 @@ def process_lytd_logic(df_lytd, calc_date):
     log("    > Calculating LYTD & LYM Sales from Apr 2025 data...")
     try:
         if 'STORE_NBR' in df_lytd.columns and 'ITEM_NUMBER' in df_lytd.columns:
-            s_store = pd.to_numeric(df_lytd['STORE_NBR'], errors='coerce').fillna(0).astype('int64').astype(str)
-            s_item = pd.to_numeric(df_lytd['ITEM_NUMBER'], errors='coerce').fillna(0).astype('int64').astype(str)
-            df_lytd['LYTD_Key'] = s_store + s_item
+            df_lytd['LYTD_Key'] = concat_key(to_int64(df_lytd['STORE_NBR']), to_int64(df_lytd['ITEM_NUMBER']))
         else:
             log("    [ERROR] STORE_NBR or ITEM_NUMBER missing in LYTD file.")
             return None
@@ -315,17 +556,21 @@ def process_lytd_logic(df_lytd, calc_date):
             if col_name in df_lytd.columns:
                 cols_lytd.append(col_name)
         
+        # One float64 block for the whole month; the to-date sum is a column slice of it
+        cols_lym = [c for c in df_lytd.columns if c.startswith('Sales_Apr_')]
+        block = sales_block(df_lytd, cols_lym) if cols_lym else None
+
         if not cols_lytd:
             df_lytd['LYTD Sales'] = 0
         else:
-            df_lytd['LYTD Sales'] = df_lytd[cols_lytd].apply(pd.to_numeric, errors='coerce').sum(axis=1)
+            pos = [cols_lym.index(c) for c in cols_lytd]
+            df_lytd['LYTD Sales'] = np.nansum(block[:, pos], axis=1)
 
         # 2. Calculate LYM Sales (Total Apr 2025 Sales)
-        cols_lym = [c for c in df_lytd.columns if c.startswith('Sales_Apr_')] # <--- UPDATED
         if not cols_lym:
             df_lytd['LYM Sales'] = 0
         else:
-            df_lytd['LYM Sales'] = df_lytd[cols_lym].apply(pd.to_numeric, errors='coerce').sum(axis=1)
+            df_lytd['LYM Sales'] = np.nansum(block, axis=1)
 
         return df_lytd[['LYTD_Key', 'LYTD Sales', 'LYM Sales']]
 
@@ -334,106 +579,157 @@ def process_lytd_logic(df_lytd, calc_date):
         return None
 
 
+def iter_row_chunks(data, chunk_rows):
+    """Yields a pyarrow Table or DataFrame as DataFrame slices, converting Arrow data one slice at a time."""
+    is_table = isinstance(data, pa.Table)
+    n_rows = data.num_rows if is_table else len(data)
+    # max(..., 1) still yields one (empty) slice for an empty report
+    for start in range(0, max(n_rows, 1), chunk_rows):
+        if is_table:
+            yield data.slice(start, chunk_rows).to_pandas()
+        else:
+            yield data.iloc[start:start + chunk_rows].copy()
+
+def prepare_article_lookups(df_hirarchy, df_div, df_instock, df_gst, df_ytd, df_lmtd, df_lytd):
+    """Indexes each lookup table by its join key once, so every chunk of the report only has to join."""
+    lookups = {}
+    if df_hirarchy is not None:
+        df_hirarchy['Location_Key'] = to_int64(df_hirarchy['Location'])
+        hier_cols = ['Location_Key', 'Market Manager']
+        if 'Region' in df_hirarchy.columns:
+            hier_cols.append('Region')
+        elif 'Market' in df_hirarchy.columns:
+            df_hirarchy.rename(columns={'Market': 'Region'}, inplace=True)
+            hier_cols.append('Region')
+        lookups['hirarchy'] = df_hirarchy[hier_cols].set_index('Location_Key')
+
+    if df_div is not None:
+        lookups['div'] = df_div[['Sub Division', 'Sub Division_V1']].set_index('Sub Division')
+
+    # Negative keys mark a missing store or a blank UID; they are left out so they never match a report row
+    if df_instock is not None:
+        kvi_cols = ['key', 'KVI_Flag', 'KVI_Allocation', 'KVI_Utilization']
+        lookups['kvi'] = df_instock.loc[df_instock['key'] >= 0, kvi_cols].set_index('key')
+
+    if df_gst is not None:
+        gst_uids = to_int64(df_gst['UID'], fill=-1)
+        lookups['gst'] = pd.Index(gst_uids[gst_uids >= 0].unique())
+
+    if df_ytd is not None:
+        df_ytd['Article UID'] = to_int64(df_ytd['Article UID'], fill=-1)
+        ytd_cols = [c for c in ['Article UID'] + YTD_SALES_COLS if c in df_ytd.columns]
+        lookups['ytd'] = df_ytd.loc[df_ytd['Article UID'] >= 0, ytd_cols].set_index('Article UID')
+
+    if df_lmtd is not None:
+        lookups['lmtd'] = df_lmtd.set_index('LMTD_Key')
+    if df_lytd is not None:
+        lookups['lytd'] = df_lytd.set_index('LYTD_Key')
+    return lookups
+
+def transform_article_chunk(df, lookups, calc_date):
+    """Runs steps 1-10 of the pipeline (keys, joins, metrics, filters) on one slice of the report."""
+    # Column presence is checked against a snapshot, refreshed after steps that add columns
+    cols = frozenset(df.columns)
+
+    # 1. Generate Article UID
+    if 'Article No' in cols and 'Store No' in cols:
+        uid = concat_key(to_int64(df['Store No']), to_int64(df['Article No']))
+        df.insert(df.columns.get_loc('Article No')+1, 'Article UID', uid)
+        cols = frozenset(df.columns)
+
+    # ======================================================================
+    # 2. Merge Hierarchy
+    # ======================================================================
+    if 'hirarchy' in lookups and 'Store No' in cols:
+        df['Store_Key'] = to_int64(df['Store No'])
+        df = df.join(lookups['hirarchy'], on='Store_Key', how='left')
+        df.drop(columns=['Store_Key'], inplace=True, errors='ignore')
+
+    # 3. Merge Division V1
+    if 'div' in lookups and 'Sub Division' in cols:
+        div = lookups['div']
+        # Both files normally parse this as text; only fall back to strings when they disagree
+        if df['Sub Division'].dtype != div.index.dtype:
+            df['Sub Division'] = df['Sub Division'].astype(str)
+            div = div.set_axis(div.index.astype(str))
+        df = df.join(div, on='Sub Division', how='left')
+
+    # 4. Merge KVI Status
+    if 'kvi' in lookups and 'Article UID' in cols:
+        df = df.join(lookups['kvi'], on='Article UID', how='left')
+
+    # 5. Flag GST Changes (set membership; stored as a 2-value categorical of '' / 'Yes')
+    if 'gst' in lookups and 'Article UID' in cols:
+        in_gst = df['Article UID'].isin(lookups['gst']).to_numpy().astype(np.int8)
+        df['GST_Change'] = pd.Categorical.from_codes(in_gst, categories=['', 'Yes'])
+
+    # 6. Merge Historical YTD Sales
+    if 'ytd' in lookups and 'Article UID' in cols:
+        df = df.join(lookups['ytd'], on='Article UID', how='left')
+
+    # 7. Merge LMTD
+    if 'lmtd' in lookups and 'Article UID' in cols:
+         df = df.join(lookups['lmtd'], on='Article UID', how='left')
+         df['LMTD Sales'] = df['LMTD Sales'].fillna(0)
+         df['LM Sales'] = df['LM Sales'].fillna(0)
+
+    # 8. Merge LYTD
+    if 'lytd' in lookups and 'Article UID' in cols:
+         df = df.join(lookups['lytd'], on='Article UID', how='left')
+         df['LYTD Sales'] = df['LYTD Sales'].fillna(0)
+         df['LYM Sales'] = df['LYM Sales'].fillna(0)
+
+    # 9. Calculate Metrics
+    cols = frozenset(df.columns)
+    # Derived metrics are computed on plain float64 arrays, so the report shows the same figures as the source
+    day_of_year = calc_date.timetuple().tm_yday
+    if day_of_year > 0:
+        days = float(day_of_year)
+        sales_cols = ['YTD Sale Amt', '2021 YTD Sales', '2022 YTD Sales', '2023 YTD Sales', '2024 YTD Sales', '2025 YTD Sales']
+        for col in sales_cols:
+            if col in cols:
+                avg_col_name = col.replace('YTD Sales', 'Avg Sales').replace('Sale Amt', 'Avg Sales')
+                df[avg_col_name] = as_float64(df[col]) / days
+        
+        if 'YTD COST Amt' in cols and 'On Hand Cost' in cols:
+            daily_cost_burn = as_float64(df['YTD COST Amt']) / days
+            on_hand_val = as_float64(df['On Hand Cost'])
+            with np.errstate(divide='ignore', invalid='ignore'):
+                day_on_hand = on_hand_val / daily_cost_burn
+            day_on_hand[np.isinf(day_on_hand)] = np.nan
+            df['Day On Hand'] = day_on_hand
+            
+            # One comparison picks the remark code: 0 = <= 7 days, 1 = > 7 days, 2 = no value
+            codes = (day_on_hand > 7).astype(np.int8)
+            codes[np.isnan(day_on_hand)] = 2
+            df['Final Remarks'] = pd.Categorical.from_codes(codes, categories=['Stock Required', 'Price Support Required', ''])
+
+    # 10. Clean up
+    cols_drop = ['WEEK4_COST', 'WEEK4_QTY', 'WEEEK4_Sales', 'WEEK4_Sales']
+    df.drop(columns=[c for c in cols_drop if c in cols], inplace=True)
+
+    # Build one keep-mask so the frame is copied once, not once per filter
+    keep = np.ones(len(df), dtype=bool)
+    if 'Article Status' in cols: 
+        keep &= category_mask(df['Article Status'], lambda v: v.strip().upper() != 'D')
+    if 'Division' in cols: 
+        keep &= category_mask(df['Division'], lambda v: v.lower() not in ('freebies', 'service article'))
+    if 'Store' in cols: 
+        keep &= category_mask(df['Store'], lambda v: v.strip().lower() != 'lucknow fc')
+    return df.loc[keep]
+
 def process_article_sales_report(df, df_hirarchy, df_div, df_instock, df_gst, df_ytd, df_lmtd, df_lytd, calc_date):
-    """The Master Transformation Function."""
+    """The Master Transformation Function. `df` may be a DataFrame or the pyarrow Table from load_file_to_df."""
     log("    > Processing Article Sales Report (Transformation Pipeline)...")
     if df is None: return None
     
     try:
-        # 1. Generate Article UID
-        if 'Article No' in df.columns and 'Store No' in df.columns:
-            s_store = pd.to_numeric(df['Store No'], errors='coerce').fillna(0).astype('int64').astype(str)
-            s_article = pd.to_numeric(df['Article No'], errors='coerce').fillna(0).astype('int64').astype(str)
-            df.insert(df.columns.get_loc('Article No')+1, 'Article UID', s_store + s_article)
+        lookups = prepare_article_lookups(df_hirarchy, df_div, df_instock, df_gst, df_ytd, df_lmtd, df_lytd)
 
-        # ======================================================================
-        # 2. Merge Hierarchy
-        # ======================================================================
-        if df_hirarchy is not None and 'Store No' in df.columns:
-            df['Store_Key'] = pd.to_numeric(df['Store No'], errors='coerce').fillna(0).astype('int64').astype(str)
-            df_hirarchy['Location_Key'] = pd.to_numeric(df_hirarchy['Location'], errors='coerce').fillna(0).astype('int64').astype(str)
-            
-            hier_cols = ['Location_Key', 'Market Manager']
-            if 'Region' in df_hirarchy.columns:
-                hier_cols.append('Region')
-            elif 'Market' in df_hirarchy.columns:
-                df_hirarchy.rename(columns={'Market': 'Region'}, inplace=True)
-                hier_cols.append('Region')
-            
-            df = df.merge(df_hirarchy[hier_cols], left_on='Store_Key', right_on='Location_Key', how='left')
-            df.drop(columns=['Location_Key', 'Store_Key'], inplace=True, errors='ignore')
-
-        # 3. Merge Division V1
-        if df_div is not None and 'Sub Division' in df.columns:
-            df['Sub Division'] = df['Sub Division'].astype(str)
-            df_div['Sub Division'] = df_div['Sub Division'].astype(str)
-            df = df.merge(df_div[['Sub Division', 'Sub Division_V1']], on='Sub Division', how='left')
-
-        # 4. Merge KVI Status
-        if df_instock is not None and 'Article UID' in df.columns:
-            df['Article UID'] = df['Article UID'].astype(str)
-            df_instock['key'] = df_instock['key'].astype(str)
-            df = df.merge(df_instock[['key', 'KVI_Flag', 'KVI_Allocation', 'KVI_Utilization']], left_on='Article UID', right_on='key', how='left')
-            df.drop(columns=['key'], inplace=True, errors='ignore')
-
-        # 5. Merge GST Changes
-        if df_gst is not None and 'Article UID' in df.columns:
-            df_gst['UID'] = df_gst['UID'].astype(str)
-            df_gst['GST_Change'] = 'Yes'
-            df = df.merge(df_gst[['UID', 'GST_Change']], left_on='Article UID', right_on='UID', how='left')
-            df['GST_Change'] = df['GST_Change'].fillna('')
-            df.drop(columns=['UID'], inplace=True, errors='ignore')
-
-        # 6. Merge Historical YTD Sales
-        if df_ytd is not None and 'Article UID' in df.columns:
-            df['Article UID'] = df['Article UID'].astype(str).str.replace(r'\.0$', '', regex=True)
-            df_ytd['Article UID'] = pd.to_numeric(df_ytd['Article UID'], errors='coerce').fillna(-1).astype('int64').astype(str)
-            ytd_cols = [c for c in ['Article UID', '2021 YTD Sales', '2022 YTD Sales', '2023 YTD Sales', '2024 YTD Sales', '2025 YTD Sales'] if c in df_ytd.columns]
-            df = df.merge(df_ytd[ytd_cols], on='Article UID', how='left')
-
-        # 7. Merge LMTD
-        if df_lmtd is not None and 'Article UID' in df.columns:
-             df = df.merge(df_lmtd, left_on='Article UID', right_on='LMTD_Key', how='left')
-             df['LMTD Sales'] = df['LMTD Sales'].fillna(0)
-             df['LM Sales'] = df['LM Sales'].fillna(0)
-             df.drop(columns=['LMTD_Key'], inplace=True, errors='ignore')
-
-        # 8. Merge LYTD
-        if df_lytd is not None and 'Article UID' in df.columns:
-             df = df.merge(df_lytd, left_on='Article UID', right_on='LYTD_Key', how='left')
-             df['LYTD Sales'] = df['LYTD Sales'].fillna(0)
-             df['LYM Sales'] = df['LYM Sales'].fillna(0)
-             df.drop(columns=['LYTD_Key'], inplace=True, errors='ignore')
-
-        # 9. Calculate Metrics
-        day_of_year = calc_date.timetuple().tm_yday
-        if day_of_year > 0:
-            sales_cols = ['YTD Sale Amt', '2021 YTD Sales', '2022 YTD Sales', '2023 YTD Sales', '2024 YTD Sales', '2025 YTD Sales']
-            for col in sales_cols:
-                if col in df.columns:
-                    avg_col_name = col.replace('YTD Sales', 'Avg Sales').replace('Sale Amt', 'Avg Sales')
-                    df[avg_col_name] = pd.to_numeric(df[col], errors='coerce') / day_of_year
-            
-            if 'YTD COST Amt' in df.columns and 'On Hand Cost' in df.columns:
-                daily_cost_burn = pd.to_numeric(df['YTD COST Amt'], errors='coerce') / day_of_year
-                on_hand_val = pd.to_numeric(df['On Hand Cost'], errors='coerce')
-                df['Day On Hand'] = on_hand_val / daily_cost_burn
-                df['Day On Hand'] = df['Day On Hand'].replace([np.inf, -np.inf], np.nan)
-                
-                conditions = [(df['Day On Hand'] > 7), (df['Day On Hand'] <= 7)]
-                choices = ['Price Support Required', 'Stock Required']
-                df['Final Remarks'] = np.select(conditions, choices, default='')
-
-        # 10. Clean up
-        cols_drop = ['WEEK4_COST', 'WEEK4_QTY', 'WEEEK4_Sales', 'WEEK4_Sales']
-        df.drop(columns=[c for c in cols_drop if c in df.columns], inplace=True)
-
-        if 'Article Status' in df.columns: 
-            df = df[df['Article Status'].astype(str).str.strip().str.upper() != 'D']
-        if 'Division' in df.columns: 
-            df = df[~df['Division'].astype(str).str.lower().isin(['freebies', 'service article'])]
-        if 'Store' in df.columns: 
-            df = df[df['Store'].astype(str).str.strip().str.lower() != 'lucknow fc']
+        # Steps 1-10 work row by row, so they run on slices and only the filtered rows are kept
+        parts = [transform_article_chunk(chunk, lookups, calc_date) for chunk in iter_row_chunks(df, ARTICLE_CHUNK_ROWS)]
+        df = pd.concat(parts, ignore_index=True)
+        del parts
 
         # 11. REORDER COLUMNS
         desired_order = [
@@ -452,11 +748,11 @@ def process_article_sales_report(df, df_hirarchy, df_div, df_instock, df_gst, df
             "LMTD Sales", "LM Sales", "LYTD Sales", "LYM Sales", "Final Remarks"
         ]
         
-        final_columns = [col for col in desired_order if col in df.columns]
-        remaining_cols = [col for col in df.columns if col not in final_columns]
-        final_columns.extend(remaining_cols)
+        have, wanted = set(df.columns), set(desired_order)
+        final_columns = [col for col in desired_order if col in have]
+        final_columns.extend(col for col in df.columns if col not in wanted)
         
-        df = df[final_columns]
+        df = df.reindex(columns=final_columns)
         log(f"    > Columns Reordered. Final Rows: {len(df)}")
         return df
 
@@ -468,6 +764,30 @@ def process_article_sales_report(df, df_hirarchy, df_div, df_instock, df_gst, df
 # SECTION 3: ADVANCED INTELLIGENCE ENGINE (EXCEL + GRAPHS)
 # ==============================================================================
 
+def write_frame(ws, df, first_row, first_col, header_fmt):
+    """Writes a DataFrame header + values row by row, leaving NaN cells blank like DataFrame.to_excel."""
+    ws.write_row(first_row, first_col, list(df.columns), header_fmt)
+    columns = [s.astype(object).where(s.notna(), None).tolist() for _, s in df.items()]
+    for r, row in enumerate(zip(*columns)):
+        ws.write_row(first_row + 1 + r, first_col, row)
+
+def frame_rows(df):
+    """Converts a DataFrame to row tuples one column at a time (no object-array round trip)."""
+    return list(zip(*(s.tolist() for _, s in df.items())))
+
+def write_blocks(ws, first_row, blocks):
+    """Writes side-by-side tables row by row (constant_memory only accepts rows in order).
+    Each block is (first_col, rows, formats); formats is a single format or one per column."""
+    depth = max((len(rows) for _, rows, _ in blocks), default=0)
+    for r in range(depth):
+        for first_col, rows, formats in blocks:
+            if r >= len(rows): continue
+            if isinstance(formats, list):
+                for c, val in enumerate(rows[r]):
+                    ws.write(first_row + r, first_col + c, val, formats[c])
+            else:
+                ws.write_row(first_row + r, first_col, rows[r], formats)
+
 def generate_excel_insights_report(df, date_str):
     """Generates Excel Dashboard with specific Store-Level Opportunity Analysis."""
     log("    > Spinning up Intelligence Engine (Excel Generation)...")
@@ -481,11 +801,21 @@ def generate_excel_insights_report(df, date_str):
         'LM Sales', 'LYM Sales', 'On Hand Qty', 'Selling Price (With Tax)',
         'On Order Qty'
     ]
-    for col in numeric_cols:
-        if col in df.columns: 
-            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-
-    with pd.ExcelWriter(output, engine='xlsxwriter', engine_kwargs={'options': {'nan_inf_to_errors': True}}) as writer:
+    numeric_present = [c for c in numeric_cols if c in df.columns]
+    df[numeric_present] = df[numeric_present].apply(pd.to_numeric, errors='coerce').fillna(0)
+    # IM % columns are averaged, so blanks stay NaN (skipped by mean) instead of becoming 0
+    im_present = [c for c in ['MTD IM %', 'YTD IM %'] if c in df.columns]
+    df[im_present] = df[im_present].apply(pd.to_numeric, errors='coerce')
+
+    # Dictionary-encode the grouping columns so every groupby below hashes integer codes.
+    # Categories are sorted like the strings, so group and sort order is unchanged.
+    for col in ['Store', 'Vendor Name', 'Article Description', 'Sub Division_V1', 'Sub Division', 'Final Remarks']:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+
+    # constant_memory flushes each row as it is finished; the strings_to_* switches keep every text cell a plain string
+    excel_options = {'nan_inf_to_errors': True, 'constant_memory': True, 'strings_to_urls': False, 'strings_to_formulas': False}
+    with pd.ExcelWriter(output, engine='xlsxwriter', engine_kwargs={'options': excel_options}) as writer:
         workbook = writer.book
         
         # --- FORMATS ---
@@ -494,17 +824,23 @@ def generate_excel_insights_report(df, date_str):
         fmt_currency = workbook.add_format({'num_format': '₹ #,##0.00'})
         fmt_number = workbook.add_format({'num_format': '#,##0'})
         fmt_pct = workbook.add_format({'num_format': '0.0%'})
+        fmt_table_head = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+        fmt_title = workbook.add_format({'bold': True, 'font_size': 14})
+        fmt_ratio = workbook.add_format({'num_format': '0.00'})
         
         # ======================================================================
         # SHEET 1: DASHBOARD
         # ======================================================================
         ws_dash = workbook.add_worksheet('Dashboard')
         
-        total_ftd = df['FTD Sale Amt'].sum() if 'FTD Sale Amt' in df.columns else 0
-        total_ytd = df['YTD Sale Amt'].sum() if 'YTD Sale Amt' in df.columns else 0
-        total_inv = df['On Hand Cost'].sum() if 'On Hand Cost' in df.columns else 0
-        total_lmtd = df['LMTD Sales'].sum() if 'LMTD Sales' in df.columns else 0
-        total_lytd = df['LYTD Sales'].sum() if 'LYTD Sales' in df.columns else 0
+        # All KPI totals come from one reduction over the columns that are present
+        kpi_cols = [c for c in ['FTD Sale Amt', 'YTD Sale Amt', 'On Hand Cost', 'LMTD Sales', 'LYTD Sales'] if c in df.columns]
+        sums = df[kpi_cols].sum(numeric_only=True)
+        total_ftd = sums.get('FTD Sale Amt', 0)
+        total_ytd = sums.get('YTD Sale Amt', 0)
+        total_inv = sums.get('On Hand Cost', 0)
+        total_lmtd = sums.get('LMTD Sales', 0)
+        total_lytd = sums.get('LYTD Sales', 0)
         efficiency = (total_ytd / total_inv) if total_inv > 0 else 0
         
         data_kpi = [
@@ -517,17 +853,15 @@ def generate_excel_insights_report(df, date_str):
             ['Capital Efficiency Ratio', efficiency]
         ]
         
-        ws_dash.write('B2', f"DAILY INTELLIGENCE REPORT: {date_str}", workbook.add_format({'bold': True, 'font_size': 14}))
+        ws_dash.write('B2', f"DAILY INTELLIGENCE REPORT: {date_str}", fmt_title)
         
         for i, row in enumerate(data_kpi):
-            fmt = fmt_header if i == 0 else fmt_currency
-            if i == 6: fmt = workbook.add_format({'num_format': '0.00'}) 
-            ws_dash.write(4 + i, 1, row[0], fmt)
-            ws_dash.write(4 + i, 2, row[1], fmt)
+            fmt = fmt_header if i == 0 else fmt_ratio if i == 6 else fmt_currency
+            ws_dash.write_row(4 + i, 1, row, fmt)
 
         if 'Store' in df.columns and 'FTD Sale Amt' in df.columns:
-            top_stores = df.groupby('Store')['FTD Sale Amt'].sum().nlargest(10).reset_index()
-            top_stores.to_excel(writer, sheet_name='Dashboard', startrow=12, startcol=1, index=False)
+            top_stores = df.groupby('Store', observed=True)['FTD Sale Amt'].sum().nlargest(10).reset_index()
+            write_frame(ws_dash, top_stores, 12, 1, fmt_table_head)
             
             chart_col = workbook.add_chart({'type': 'column'})
             chart_col.add_series({
@@ -548,54 +882,41 @@ def generate_excel_insights_report(df, date_str):
             ws_pareto.write('A1', 'STORE PARETO SUMMARY (Based on FTD Sales)', fmt_header)
             headers = ['Store', 'Total Articles Sold', 'Power SKUs (80% Sales)', 'Tail SKUs (20% Sales)', 
                        'Total FTD Sales', 'Total MTD Sales', 'Total YTD Sales', 'Total LMTD Sales', 'Total LYTD Sales']
-            for c, h in enumerate(headers): ws_pareto.write(2, c, h, fmt_subhead)
+            ws_pareto.write_row(2, 0, headers, fmt_subhead)
             
-            stores = df['Store'].unique()
+            # One stable sort + grouped cumsum classifies every store at once. Stores are ranked by
+            # first appearance in the report, which is the order the summary has always used.
+            store_names = pd.Index(df['Store'].dropna().unique())
+            value_cols = [c for c in ['FTD Sale Amt', 'MTD Sale Amt', 'YTD Sale Amt', 'LMTD Sales', 'LYTD Sales'] if c in df.columns]
+            sold = df.loc[(df['FTD Sale Amt'] > 0) & df['Store'].notna(), ['Store', 'Article UID', 'Article Description'] + value_cols]
+            sold['Store_Rank'] = store_names.get_indexer(sold['Store'])
+            sold = sold.sort_values(['Store_Rank', 'FTD Sale Amt'], ascending=[True, False], kind='stable')
+
+            by_store = sold.groupby('Store_Rank', sort=True)
+            cum_pct = by_store['FTD Sale Amt'].cumsum() / by_store['FTD Sale Amt'].transform('sum')
+            sold['Pareto_Class'] = np.where(cum_pct <= 0.80, 'A (Top 80%)', 'B (Tail 20%)')
+            is_power = sold['Pareto_Class'] == 'A (Top 80%)'
+
+            summary_cols = ['FTD Sale Amt', 'MTD Sale Amt', 'YTD Sale Amt', 'LMTD Sales', 'LYTD Sales']
+            totals = by_store[value_cols].sum().reindex(columns=summary_cols, fill_value=0)
+            articles = by_store.size()
+            power_counts = is_power.groupby(sold['Store_Rank'], sort=True).sum()
+
+            # Every group aggregate is indexed by rank in the same order; tolist() hands xlsxwriter plain Python numbers
+            summary = zip(articles.index.tolist(), articles.tolist(), power_counts.tolist(), totals.to_numpy().tolist())
             row_idx = 3
-            pareto_details_list = []
-            
-            for store in stores:
-                store_df = df[(df['Store'] == store) & (df['FTD Sale Amt'] > 0)].copy()
-                if store_df.empty: continue
-                
-                store_df = store_df.sort_values(by='FTD Sale Amt', ascending=False)
-                total_sales = store_df['FTD Sale Amt'].sum()
-                store_df['Cum_Sales'] = store_df['FTD Sale Amt'].cumsum()
-                store_df['Cum_Pct'] = store_df['Cum_Sales'] / total_sales
-                
-                store_df['Pareto_Class'] = np.where(store_df['Cum_Pct'] <= 0.80, 'A (Top 80%)', 'B (Tail 20%)')
-                
-                total_articles = len(store_df)
-                power_skus = len(store_df[store_df['Pareto_Class'] == 'A (Top 80%)'])
-                tail_skus = total_articles - power_skus
-                
-                ftd_val = store_df['FTD Sale Amt'].sum()
-                mtd_val = store_df['MTD Sale Amt'].sum()
-                ytd_val = store_df['YTD Sale Amt'].sum()
-                lmtd_val = store_df['LMTD Sales'].sum() if 'LMTD Sales' in store_df.columns else 0
-                lytd_val = store_df['LYTD Sales'].sum() if 'LYTD Sales' in store_df.columns else 0
-                
-                ws_pareto.write(row_idx, 0, store)
-                ws_pareto.write(row_idx, 1, total_articles, fmt_number)
-                ws_pareto.write(row_idx, 2, power_skus, fmt_number)
-                ws_pareto.write(row_idx, 3, tail_skus, fmt_number)
-                ws_pareto.write(row_idx, 4, ftd_val, fmt_currency)
-                ws_pareto.write(row_idx, 5, mtd_val, fmt_currency)
-                ws_pareto.write(row_idx, 6, ytd_val, fmt_currency)
-                ws_pareto.write(row_idx, 7, lmtd_val, fmt_currency)
-                ws_pareto.write(row_idx, 8, lytd_val, fmt_currency)
-                
+            for rank, total_articles, power_skus, store_totals in summary:
+                ws_pareto.write(row_idx, 0, store_names[rank])
+                ws_pareto.write_row(row_idx, 1, [total_articles, power_skus, total_articles - power_skus], fmt_number)
+                ws_pareto.write_row(row_idx, 4, store_totals, fmt_currency)
                 row_idx += 1
-                
-                power_items = store_df[store_df['Pareto_Class'] == 'A (Top 80%)'][['Store', 'Article UID', 'Article Description', 'FTD Sale Amt', 'Pareto_Class']]
-                pareto_details_list.append(power_items)
 
             detail_start_row = row_idx + 3
             ws_pareto.write(detail_start_row, 0, 'DETAILED POWER SKUs (Articles contributing to 80% of Sales today)', fmt_header)
             
-            if pareto_details_list:
-                full_pareto_df = pd.concat(pareto_details_list)
-                full_pareto_df.to_excel(writer, sheet_name='Pareto_Analysis', startrow=detail_start_row+1, index=False)
+            if not sold.empty:
+                full_pareto_df = sold.loc[is_power, ['Store', 'Article UID', 'Article Description', 'FTD Sale Amt', 'Pareto_Class']]
+                write_frame(ws_pareto, full_pareto_df, detail_start_row+1, 0, fmt_table_head)
 
         # ======================================================================
         # SHEET 3: REGIONAL DEEP DIVE (MODIFIED)
@@ -612,47 +933,57 @@ def generate_excel_insights_report(df, date_str):
                 'Group-5 (Punjab/J&K)': ['Amritsar', 'Jammu', 'Ludhiana-1', 'Ludhiana-3', 'Jalandhar', 'Zirakpur']
             }
 
+            # Store is categorical, so only its categories are stripped and mapped to a group; rows pick
+            # their group by code (the extra trailing slot catches code -1, a missing store)
+            store_to_group = {store: group for group, stores in store_groups.items() for store in stores}
+            category_groups = df['Store'].cat.categories.astype(str).str.strip().map(store_to_group)
+            group_lookup = np.append(np.asarray(category_groups, dtype=object), None)
+            group_of_row = pd.Series(group_lookup[df['Store'].cat.codes.to_numpy()], index=df.index)
+            group_frames = dict(tuple(df.groupby(group_of_row, sort=False)))
+
             for group_name, store_list in store_groups.items():
-                group_df = df[df['Store'].astype(str).str.strip().isin(store_list)].copy()
-                if group_df.empty: continue
+                group_df = group_frames.get(group_name)
+                if group_df is None or group_df.empty: continue
 
                 ws_region.merge_range(row_cursor, 0, row_cursor, len(store_list), f"--- {group_name} ---", fmt_header)
                 row_cursor += 1
 
                 if 'MTD Sale Amt' in group_df.columns:
-                    top_arts = group_df.groupby('Article Description')['MTD Sale Amt'].sum().nlargest(10).index.tolist()
+                    top_arts = group_df.groupby('Article Description', observed=True)['MTD Sale Amt'].sum().nlargest(10).index.tolist()
                     subset = group_df[group_df['Article Description'].isin(top_arts)]
                     
-                    pivot_sales = subset.pivot_table(index='Article Description', columns='Store', values='MTD Sale Amt', aggfunc='sum').fillna(0)
-                    pivot_stock = subset.pivot_table(index='Article Description', columns='Store', values='On Hand Qty', aggfunc='sum').fillna(0)
+                    # One grouped sum and one unstack feed both tables
+                    agg = subset.groupby(['Article Description', 'Store'], observed=True)[['MTD Sale Amt', 'On Hand Qty']].sum()
+                    wide = agg.unstack('Store', fill_value=0)
                     
-                    cols_present = [s for s in store_list if s in pivot_sales.columns]
-                    pivot_sales = pivot_sales[cols_present]
-                    pivot_stock = pivot_stock[cols_present]
+                    cols_present = [s for s in store_list if s in wide['MTD Sale Amt'].columns]
+                    pivot_sales = wide['MTD Sale Amt'][cols_present]
+                    pivot_stock = wide['On Hand Qty'][cols_present]
                     
+                    # Both tables share one index, so the rows are pulled out once as plain lists
+                    arts_present = [art for art in top_arts if art in wide.index]
+                    sales_rows = pivot_sales.reindex(arts_present).to_numpy().tolist()
+                    stock_rows = pivot_stock.reindex(arts_present).to_numpy().tolist()
+
                     # Table 1: MTD Sales
                     ws_region.write(row_cursor, 0, "Top 10 Articles (By MTD Sales)", fmt_subhead)
-                    for c, col in enumerate(cols_present): ws_region.write(row_cursor, c+1, col, fmt_subhead)
+                    ws_region.write_row(row_cursor, 1, cols_present, fmt_subhead)
                     row_cursor += 1
-                    for art in top_arts:
-                        if art in pivot_sales.index:
-                            ws_region.write(row_cursor, 0, art)
-                            for c, val in enumerate(pivot_sales.loc[art]):
-                                ws_region.write(row_cursor, c+1, val, fmt_currency)
-                            row_cursor += 1
+                    for art, vals in zip(arts_present, sales_rows):
+                        ws_region.write(row_cursor, 0, art)
+                        ws_region.write_row(row_cursor, 1, vals, fmt_currency)
+                        row_cursor += 1
                     
                     row_cursor += 1 
 
                     # Table 2: On Hand Qty
                     ws_region.write(row_cursor, 0, "Stock Status (On Hand Qty)", fmt_subhead)
-                    for c, col in enumerate(cols_present): ws_region.write(row_cursor, c+1, col, fmt_subhead)
+                    ws_region.write_row(row_cursor, 1, cols_present, fmt_subhead)
                     row_cursor += 1
-                    for art in top_arts:
-                        if art in pivot_stock.index:
-                            ws_region.write(row_cursor, 0, art)
-                            for c, val in enumerate(pivot_stock.loc[art]):
-                                ws_region.write(row_cursor, c+1, val, fmt_number)
-                            row_cursor += 1
+                    for art, vals in zip(arts_present, stock_rows):
+                        ws_region.write(row_cursor, 0, art)
+                        ws_region.write_row(row_cursor, 1, vals, fmt_number)
+                        row_cursor += 1
                     
                     row_cursor += 3
 
@@ -660,35 +991,37 @@ def generate_excel_insights_report(df, date_str):
         # SHEET 4: ACTIONABLES
         # ======================================================================
         ws_action = workbook.add_worksheet('Actionables')
+        # The three tables sit side by side, so their rows are collected first and written in row order
         ws_action.write('A1', 'URGENT REORDER (Top 50 Fast Movers)', fmt_header)
+        ws_action.write('G1', 'CASH TRAPS (High Value Dead Stock)', fmt_header)
+        ws_action.write('M1', 'MARGIN BLEED (Category Level)', fmt_header)
+        action_heads, action_rows = [], []
+
         if 'Final Remarks' in df.columns:
             urgent = df[(df['Final Remarks'] == 'Stock Required') & (df['YTD Avg Sales'] > 0)].sort_values('YTD Avg Sales', ascending=False).head(50)
             cols_urg = ['Article UID', 'Article Description', 'Store', 'Day On Hand', 'YTD Avg Sales']
-            for c, col in enumerate(cols_urg): ws_action.write(1, c, col, fmt_subhead)
-            for r, row in enumerate(urgent[cols_urg].values):
-                for c, val in enumerate(row):
-                    ws_action.write(r+2, c, val)
+            action_heads.append((0, [cols_urg], fmt_subhead))
+            action_rows.append((0, frame_rows(urgent[cols_urg]), None))
 
-        ws_action.write('G1', 'CASH TRAPS (High Value Dead Stock)', fmt_header)
         if 'Day On Hand' in df.columns:
             traps = df[(df['Day On Hand'] > 180) & (df['On Hand Cost'] > 50000)].sort_values('On Hand Cost', ascending=False).head(50)
             cols_trap = ['Article UID', 'Article Description', 'Store', 'Day On Hand', 'On Hand Cost']
-            for c, col in enumerate(cols_trap): ws_action.write(1, c+6, col, fmt_subhead)
-            for r, row in enumerate(traps[cols_trap].values):
-                for c, val in enumerate(row):
-                    ws_action.write(r+2, c+6, val)
+            action_heads.append((6, [cols_trap], fmt_subhead))
+            action_rows.append((6, frame_rows(traps[cols_trap]), None))
 
-        ws_action.write('M1', 'MARGIN BLEED (Category Level)', fmt_header)
         cat_col = 'Sub Division_V1' if 'Sub Division_V1' in df.columns else 'Sub Division'
         if cat_col in df.columns and 'MTD IM %' in df.columns:
-            margin = df.groupby(cat_col)[['MTD IM %', 'YTD IM %']].mean()
-            margin['Drop'] = margin['YTD IM %'] - margin['MTD IM %']
-            bleeders = margin[margin['Drop'] > 2].sort_values('Drop', ascending=False).reset_index()
+            margin = df.groupby(cat_col, observed=True)[['MTD IM %', 'YTD IM %']].mean()
+            # The drop is computed on plain arrays and only the bleeding categories get a Drop column
+            drop = margin['YTD IM %'].to_numpy() - margin['MTD IM %'].to_numpy()
+            keep = drop > 2
+            bleeders = margin[keep].assign(Drop=drop[keep]).sort_values('Drop', ascending=False).reset_index()
             cols_marg = [cat_col, 'MTD IM %', 'YTD IM %', 'Drop']
-            for c, col in enumerate(cols_marg): ws_action.write(1, c+12, col, fmt_subhead)
-            for r, row in enumerate(bleeders[cols_marg].values):
-                for c, val in enumerate(row):
-                    ws_action.write(r+2, c+12, val)
+            action_heads.append((12, [cols_marg], fmt_subhead))
+            action_rows.append((12, frame_rows(bleeders[cols_marg]), None))
+
+        write_blocks(ws_action, 1, action_heads)
+        write_blocks(ws_action, 2, action_rows)
 
         # ======================================================================
         # SHEET 5: OPPORTUNITY ANALYSIS
@@ -698,26 +1031,19 @@ def generate_excel_insights_report(df, date_str):
         req_cols = ['Store', 'Article Description', 'LMTD Sales', 'MTD Sale Amt', 'On Hand Qty', 'LYM Sales', 'Selling Price (With Tax)']
         if all(c in df.columns for c in req_cols):
             
-            df['Sales_Drop_Value'] = df['LMTD Sales'] - df['MTD Sale Amt']
-            mask = (df['Sales_Drop_Value'] > 0) & (df['On Hand Qty'] > 100)
-            opp_df = df[mask].copy()
+            # LMTD - MTD > 0 is LMTD > MTD, so the drop is only materialised for the matching rows
+            mask = (df['LMTD Sales'] > df['MTD Sale Amt']) & (df['On Hand Qty'] > 100)
+            opp_df = df.loc[mask, req_cols]
+            opp_df['Sales_Drop_Value'] = opp_df['LMTD Sales'] - opp_df['MTD Sale Amt']
             opp_df = opp_df.sort_values(by=['Store', 'Sales_Drop_Value'], ascending=[True, False])
-            top_opps = opp_df.groupby('Store').head(10)
+            top_opps = opp_df[opp_df.groupby('Store', sort=False, observed=True).cumcount() < 10]
             
             out_cols = ['Store', 'Article Description', 'LMTD Sales', 'MTD Sale Amt', 'Sales_Drop_Value', 'On Hand Qty', 'LYM Sales', 'Selling Price (With Tax)']
             
             ws_opp.write('A1', "Opportunity Analysis: High LMTD vs Low MTD (Stock > 100)", fmt_header)
-            for c, col in enumerate(out_cols): ws_opp.write(3, c, col, fmt_subhead)
-            for r, row in enumerate(top_opps[out_cols].values):
-                row_num = r + 4
-                ws_opp.write(row_num, 0, row[0])
-                ws_opp.write(row_num, 1, row[1])
-                ws_opp.write(row_num, 2, row[2], fmt_currency)
-                ws_opp.write(row_num, 3, row[3], fmt_currency)
-                ws_opp.write(row_num, 4, row[4], fmt_currency)
-                ws_opp.write(row_num, 5, row[5], fmt_number)
-                ws_opp.write(row_num, 6, row[6], fmt_currency)
-                ws_opp.write(row_num, 7, row[7], fmt_currency)
+            ws_opp.write_row(3, 0, out_cols, fmt_subhead)
+            col_fmts = [None, None, fmt_currency, fmt_currency, fmt_currency, fmt_number, fmt_currency, fmt_currency]
+            write_blocks(ws_opp, 4, [(0, frame_rows(top_opps[out_cols]), col_fmts)])
             
             if not top_opps.empty:
                 last_row = len(top_opps) + 4
@@ -731,41 +1057,39 @@ def generate_excel_insights_report(df, date_str):
         # ======================================================================
         ws_sniper = workbook.add_worksheet('Sniper_View')
         
-        # 1. INBOUND DISASTER CHECK (High On Order, Low Sales)
+        # Titles first, then the three side-by-side tables in row order
         ws_sniper.write('A1', '🚨 INBOUND DISASTERS (Cancel These POs)', fmt_header)
+        ws_sniper.write('F1', '🧟 ZOMBIE STOCK (>180 Days Old)', fmt_header)
+        ws_sniper.write('L1', '⭐ KVI STOCKOUTS (Must Fill)', fmt_header)
+        sniper_heads, sniper_rows = [], []
+
+        # 1. INBOUND DISASTER CHECK (High On Order, Low Sales)
         if 'On Order Qty' in df.columns and 'MTD Sale Amt' in df.columns:
             risky_po = df[(df['On Order Qty'] > 200) & (df['MTD Sale Amt'] < 1000)].sort_values('On Order Qty', ascending=False).head(30)
             cols_po = ['Store', 'Article Description', 'On Order Qty', 'MTD Sale Amt']
-            for c, col in enumerate(cols_po): ws_sniper.write(1, c, col, fmt_subhead)
-            for r, row in enumerate(risky_po[cols_po].values):
-                ws_sniper.write(r+2, 0, row[0])
-                ws_sniper.write(r+2, 1, row[1])
-                ws_sniper.write(r+2, 2, row[2], fmt_number)
-                ws_sniper.write(r+2, 3, row[3], fmt_currency)
+            sniper_heads.append((0, [cols_po], fmt_subhead))
+            sniper_rows.append((0, frame_rows(risky_po[cols_po]), [None, None, fmt_number, fmt_currency]))
 
         # 2. ZOMBIE INVENTORY (Old GRN, Unsold)
-        ws_sniper.write('F1', '🧟 ZOMBIE STOCK (>180 Days Old)', fmt_header)
         if 'Last GRN Date' in df.columns and 'On Hand Qty' in df.columns:
-            df['GRN_DT'] = pd.to_datetime(df['Last GRN Date'], errors='coerce')
+            grn_dt = pd.to_datetime(df['Last GRN Date'], errors='coerce')
             six_months_ago = pd.Timestamp.now() - pd.Timedelta(days=180)
-            zombies = df[(df['GRN_DT'] < six_months_ago) & (df['On Hand Qty'] > 10)].copy()
+            cols_zom = ['Store', 'Article Description', 'Last GRN Date', 'On Hand Qty', 'On Hand Cost']
+            zombies = df.loc[(grn_dt < six_months_ago) & (df['On Hand Qty'] > 10), cols_zom]
             if not zombies.empty:
                 zombies = zombies.sort_values('On Hand Cost', ascending=False).head(30)
-                cols_zom = ['Store', 'Article Description', 'Last GRN Date', 'On Hand Qty', 'On Hand Cost']
-                for c, col in enumerate(cols_zom): ws_sniper.write(1, c+5, col, fmt_subhead)
-                for r, row in enumerate(zombies[cols_zom].values):
-                    for c, val in enumerate(row):
-                        ws_sniper.write(r+2, c+5, val)
+                sniper_heads.append((5, [cols_zom], fmt_subhead))
+                sniper_rows.append((5, frame_rows(zombies[cols_zom]), None))
 
         # 3. KVI STOCKOUTS (Critical)
-        ws_sniper.write('L1', '⭐ KVI STOCKOUTS (Must Fill)', fmt_header)
         if 'KVI_Flag' in df.columns and 'On Hand Qty' in df.columns:
             kvi_out = df[(df['KVI_Flag'].notna()) & (df['On Hand Qty'] < 5)].head(30)
             cols_kvi = ['Store', 'Article Description', 'On Hand Qty']
-            for c, col in enumerate(cols_kvi): ws_sniper.write(1, c+11, col, fmt_subhead)
-            for r, row in enumerate(kvi_out[cols_kvi].values):
-                for c, val in enumerate(row):
-                    ws_sniper.write(r+2, c+11, val)
+            sniper_heads.append((11, [cols_kvi], fmt_subhead))
+            sniper_rows.append((11, frame_rows(kvi_out[cols_kvi]), None))
+
+        write_blocks(ws_sniper, 1, sniper_heads)
+        write_blocks(ws_sniper, 2, sniper_rows)
         
         ws_sniper.set_column(0, 15, 15)
 
@@ -777,7 +1101,7 @@ def generate_excel_insights_report(df, date_str):
 
         if 'Vendor Name' in df.columns and 'Store' in df.columns:
             # 1. Aggregate metrics by Store + Vendor
-            v_agg = df.groupby(['Store', 'Vendor Name']).agg({
+            v_agg = df.groupby(['Store', 'Vendor Name'], observed=True).agg({
                 'YTD Sale Amt': 'sum',
                 'On Hand Cost': 'sum',
                 'On Order Qty': 'sum'
@@ -794,19 +1118,15 @@ def generate_excel_insights_report(df, date_str):
             v_agg = v_agg.sort_values(by=['Store', 'YTD Sale Amt'], ascending=[True, False])
 
             # 5. Take Top 15 vendors per Store
-            top_vendors = v_agg.groupby('Store').head(15)
+            top_vendors = v_agg.groupby('Store', observed=True).head(15)
 
             # 6. Write to Excel
             v_cols = ['Store', 'Vendor Name', 'YTD Sale Amt', 'On Hand Cost', 'On Order Qty', 'Stock Turn']
-            for c, col in enumerate(v_cols): ws_vendor.write(1, c, col, fmt_subhead)
+            ws_vendor.write_row(1, 0, v_cols, fmt_subhead)
 
-            for r, row in enumerate(top_vendors[v_cols].values):
-                ws_vendor.write(r+2, 0, row[0]) # Store
-                ws_vendor.write(r+2, 1, row[1]) # Vendor
-                ws_vendor.write(r+2, 2, row[2], fmt_currency) # Sales
-                ws_vendor.write(r+2, 3, row[3], fmt_currency) # Inv Cost
-                ws_vendor.write(r+2, 4, row[4], fmt_number)   # On Order
-                ws_vendor.write(r+2, 5, row[5], workbook.add_format({'num_format': '0.00'})) # Stock Turn
+            # Store, Vendor, Sales, Inv Cost, On Order, Stock Turn
+            vendor_fmts = [None, None, fmt_currency, fmt_currency, fmt_number, fmt_ratio]
+            write_blocks(ws_vendor, 2, [(0, frame_rows(top_vendors[v_cols]), vendor_fmts)])
 
             ws_vendor.set_column(0, 1, 25) # Widen columns
             ws_vendor.set_column(2, 5, 12)
@@ -821,55 +1141,78 @@ def generate_excel_insights_report(df, date_str):
 def find_files_for_date(drive_service, date_str):
     """Finds source CSV/ZIP files for a given date."""
     log(f"  Querying source files for date: {date_str}")
+    # One query for every prefix; the results are matched back by exact name
+    wanted = {f"{prefix}_{date_str}{ext}": prefix for prefix in FILE_PREFIXES for ext in ('.csv', '.zip')}
+    name_clauses = " or ".join(f"name='{name}'" for name in wanted)
+    q = f"'{SOURCE_FOLDER_ID}' in parents and ({name_clauses}) and trashed=false"
+    results = drive_service.files().list(q=q, fields="files(id, name)", **ALL_DRIVES_LIST).execute()
+
     file_info = {}
-    for prefix in FILE_PREFIXES:
-        q = f"'{SOURCE_FOLDER_ID}' in parents and (name='{prefix}_{date_str}.csv' or name='{prefix}_{date_str}.zip') and trashed=false"
-        results = drive_service.files().list(q=q, fields="files(id, name)").execute()
-        items = results.get('files', [])
-        if not items: return None
-        file_info[prefix] = (items[0]['id'], items[0]['name'])
+    for item in results.get('files', []):
+        prefix = wanted.get(item['name'])
+        if prefix: file_info.setdefault(prefix, (item['id'], item['name']))
+    if len(file_info) < len(FILE_PREFIXES): return None
     return file_info
 
 def check_and_copy_files(drive_service):
     """Main execution function."""
     if not drive_service: return
 
-    # 1. Download Helpers
     # 1. Download Helpers
     log("\n--- Phase 1: Downloading Reference Data ---")
-    df_hirarchy = download_csv_to_df(drive_service, 'hirarchy.csv', TARGET_FOLDER_ID)
-    df_div = download_csv_to_df(drive_service, 'division_group.csv', TARGET_FOLDER_ID)
-    df_gst = download_csv_to_df(drive_service, 'gst_change_list.csv', TARGET_FOLDER_ID)
-    df_ytd = download_csv_to_df(drive_service, 'ytd_sales.csv', TARGET_FOLDER_ID)
-    
     # --- UPDATED FILE NAMES FOR MARCH ---
-    df_lmtd_raw = download_csv_to_df(drive_service, '2026_mar_sales.csv', TARGET_FOLDER_ID)
-    df_lytd_raw = download_csv_to_df(drive_service, '2025_apr_sales.csv', TARGET_FOLDER_ID)
-
-    # 2. Date Fallback Logic
-    log("\n--- Phase 2: Locating Source Files ---")
-    today = datetime.date.today()
-    date_str = today.strftime('%Y-%m-%d')
-    calc_date = today - datetime.timedelta(days=1)
-    
-    file_info = find_files_for_date(drive_service, date_str)
-    
-    if not file_info:
-        log(f"  [WARN] Files for {date_str} not found. Checking yesterday...")
-        date_str = (today - datetime.timedelta(days=1)).strftime('%Y-%m-%d')
-        calc_date = today - datetime.timedelta(days=2)
+    lmtd_file, lytd_file = '2026_mar_sales.csv', '2025_apr_sales.csv'
+    helper_files = ['hirarchy.csv', 'division_group.csv', 'gst_change_list.csv', 'ytd_sales.csv', lmtd_file, lytd_file]
+    # One listing of the target folder serves every name lookup in this run
+    target_files = list_folder_files(drive_service, TARGET_FOLDER_ID)
+
+    # Helpers and main files are independent downloads, so they all share one pool
+    with ThreadPoolExecutor(max_workers=len(helper_files) + len(FILE_PREFIXES)) as executor:
+        helper_futures = {
+            name: executor.submit(
+                run_with_thread_service, download_csv_to_df, name, target_files.get(name), HELPER_COLUMNS.get(name)
+            )
+            for name in helper_files
+        }
+
+        # 2. Date Fallback Logic
+        log("\n--- Phase 2: Locating Source Files ---")
+        today = datetime.date.today()
+        date_str = today.strftime('%Y-%m-%d')
+        calc_date = today - datetime.timedelta(days=1)
+        
         file_info = find_files_for_date(drive_service, date_str)
+        
+        if not file_info:
+            log(f"  [WARN] Files for {date_str} not found. Checking yesterday...")
+            date_str = (today - datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+            calc_date = today - datetime.timedelta(days=2)
+            file_info = find_files_for_date(drive_service, date_str)
+
+        if not file_info:
+            log("❌ CRITICAL: No source files found for Today or Yesterday. Exiting.")
+            return
 
-    if not file_info:
-        log("❌ CRITICAL: No source files found for Today or Yesterday. Exiting.")
-        return
-
-    log(f"✅ Found files for {date_str}. Proceeding...")
-    
-    # 3. Load & Process Main Files
-    log("\n--- Phase 3: Loading & Processing ---")
-    df_article = load_file_to_df(drive_service, file_info['ArticleSalesReport'][0], file_info['ArticleSalesReport'][1])
-    df_instock = load_file_to_df(drive_service, file_info['Overall_Instock'][0], file_info['Overall_Instock'][1])
+        log(f"✅ Found files for {date_str}. Proceeding...")
+        
+        # 3. Load & Process Main Files
+        log("\n--- Phase 3: Loading & Processing ---")
+        # The article report stays an Arrow table until the pipeline converts it slice by slice
+        article_future = executor.submit(run_with_thread_service, load_file_to_df, *file_info['ArticleSalesReport'], True)
+        instock_future = executor.submit(run_with_thread_service, load_file_to_df, *file_info['Overall_Instock'])
+
+        df_hirarchy = compact_lookup(
+            helper_futures['hirarchy.csv'].result(), category_cols=['Market Manager', 'Region', 'Market']
+        )
+        df_div = helper_futures['division_group.csv'].result()
+        df_gst = helper_futures['gst_change_list.csv'].result()
+        df_ytd = helper_futures['ytd_sales.csv'].result()
+        df_lmtd_raw = helper_futures[lmtd_file].result()
+        df_lytd_raw = helper_futures[lytd_file].result()
+        df_article = article_future.result()
+        df_instock = instock_future.result()
+        # Finished futures hold their results, so drop them or every raw frame lives until the run ends
+        del helper_futures, article_future, instock_future
     
     df_instock = process_overall_instock(df_instock)
     df_lmtd_clean = process_lmtd_logic(df_lmtd_raw, calc_date)
@@ -879,6 +1222,8 @@ def check_and_copy_files(drive_service):
         df_article, df_hirarchy, df_div, df_instock, df_gst, df_ytd, 
         df_lmtd_clean, df_lytd_clean, calc_date
     )
+    # Only df_final and df_instock are used from here on; releasing the inputs now keeps them out of the output peak
+    del df_article, df_hirarchy, df_div, df_gst, df_ytd, df_lmtd_raw, df_lytd_raw, df_lmtd_clean, df_lytd_clean
     
     # 4. Generate Outputs
     if df_final is not None:
@@ -887,31 +1232,29 @@ def check_and_copy_files(drive_service):
         # A. Update Raw Data XLSM (SECURE VERSION)
         update_xlsm_data_sheet(
             drive_service, df_final, 
-            "article_sales_report.xlsm", "Sheet1", TARGET_FOLDER_ID
+            "article_sales_report.xlsm", "Sheet1", target_files
         )
         
         # B. Upload Raw Data CSV
         if df_instock is not None:
-            upload_df_as_csv(drive_service, df_instock, f"Overall_Instock_{date_str}.csv", TARGET_FOLDER_ID)
+            upload_df_as_csv(drive_service, df_instock, f"Overall_Instock_{date_str}.csv", TARGET_FOLDER_ID, target_files)
+        del df_instock
 
         # C. Generate & Upload Advanced Excel Dashboard
         excel_buffer = generate_excel_insights_report(df_final, date_str)
-        upload_excel_report(drive_service, excel_buffer, f"Business_Insights_Report_{date_str}.xlsx", TARGET_FOLDER_ID)
+        upload_excel_report(drive_service, excel_buffer, f"Business_Insights_Report_{date_str}.xlsx", TARGET_FOLDER_ID, target_files)
 
     # 5. Copy Originals & Cleanup
     log("\n--- Phase 5: Backup Original Files ---")
     for prefix in FILE_PREFIXES:
         f_id, f_name = file_info[prefix]
-        q = f"'{TARGET_FOLDER_ID}' in parents and name='{f_name}' and trashed=false"
-        if not drive_service.files().list(q=q).execute().get('files'):
-            drive_service.files().copy(fileId=f_id, body={'name': f_name, 'parents': [TARGET_FOLDER_ID]}).execute()
-            
-    log("  Cleaning up memory...")
-    del df_article, df_instock, df_final, df_hirarchy, df_div, df_gst, df_ytd, df_lmtd_raw, df_lytd_raw
-    gc.collect()
+        if f_name not in target_files:
+            copied = drive_service.files().copy(fileId=f_id, body={'name': f_name, 'parents': [TARGET_FOLDER_ID]}, **ALL_DRIVES).execute()
+            target_files[f_name] = copied['id']
     
     log("\n=== SUCCESS: Pipeline Completed Successfully ===")
 
 if __name__ == "__main__":
+    enable_fast_unzip()
     srv = authenticate()
     if srv: check_and_copy_files(srv)
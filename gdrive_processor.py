@@ -1,7 +1,9 @@
 import pandas as pd
 import os
+import json
 import numpy as np
-import io
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 # Google API Client libraries are required for this version.
 # Make sure to update your requirements/workflow file.
@@ -21,165 +23,173 @@ DRIVE_FILENAMES = {
     "vd_raw_file": "VD_raw_file.txt"
 }
 
-# Name for the temporary file to hold service account credentials
-SERVICE_ACCOUNT_FILE = 'gcp_service_account_key.json'
+# Uploads up to this size go up in one request; larger ones use a resumable session in big chunks.
+SIMPLE_UPLOAD_LIMIT = 5 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 16 * 1024 * 1024
+
+# Drive calls retry transient failures (429 and 5xx) this many times with exponential backoff.
+DRIVE_RETRIES = 5
 
 def setup_drive_service():
-    """Sets up the Google Drive API service using service account credentials."""
+    """Sets up the Google Drive API service using service account credentials. Returns (service, creds)."""
     print("--- Setting up Google Drive Service ---")
-    # The service account key is passed as a GitHub secret and written to a file
+    # The service account key is passed as a GitHub secret
     gcp_sa_key_json = os.getenv('GCP_SA_KEY')
     if not gcp_sa_key_json:
         print("ERROR: GCP_SA_KEY environment variable not found.")
         print("Please ensure you have set this secret in your GitHub repository settings.")
-        return None
+        return None, None
 
     try:
-        # Write the key to a temporary file for the Credentials object to read
-        with open(SERVICE_ACCOUNT_FILE, 'w') as f:
-            f.write(gcp_sa_key_json)
-
         # Define the required scopes for Google Drive API
         SCOPES = ['https://www.googleapis.com/auth/drive']
-        creds = Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE, scopes=SCOPES)
-        service = build('drive', 'v3', credentials=creds)
+        # Parse the key in memory; it is never written to disk
+        creds = Credentials.from_service_account_info(json.loads(gcp_sa_key_json), scopes=SCOPES)
+        service = build_drive_service(creds)
         print("Google Drive service created successfully.")
-        return service
+        return service, creds
     except Exception as e:
         print(f"ERROR: Failed to create Google Drive service: {e}")
-        return None
-    finally:
-        # Clean up the temporary credentials file
-        if os.path.exists(SERVICE_ACCOUNT_FILE):
-            os.remove(SERVICE_ACCOUNT_FILE)
-
-def find_and_download_file(service, folder_id, file_name):
-    """Searches for a file by name in a specific folder and downloads its content."""
-    print(f"Searching for '{file_name}' in Google Drive...")
-    try:
-        # Construct the query to search by name and parent folder, excluding trashed files
-        query = f"name = '{file_name}' and '{folder_id}' in parents and trashed = false"
-        
-        response = service.files().list(q=query, spaces='drive', fields='files(id, name)').execute()
-        files = response.get('files', [])
-
-        if not files:
-            print(f"WARNING: File '{file_name}' not found in the specified folder.")
-            return None, None  # Return None for both content and file ID
+        return None, None
 
-        # Assume the first file found is the correct one
-        file_id = files[0].get('id')
-        print(f"Found '{file_name}' with ID: {file_id}. Downloading...")
+def build_drive_service(creds):
+    """Builds a Drive client; httplib2 is not thread-safe, so every download thread builds its own."""
+    # Use the discovery document bundled with the client instead of fetching it
+    return build('drive', 'v3', credentials=creds, static_discovery=True, cache_discovery=False)
 
+def find_folder_files(service, folder_id, file_names):
+    """Looks up all the named files in a folder with a single query. Returns {name: id}."""
+    names = " or ".join(f"name = '{name}'" for name in file_names)
+    query = f"'{folder_id}' in parents and trashed = false and ({names})"
+    try:
+        response = service.files().list(q=query, spaces='drive', fields='files(id, name)', pageSize=100).execute(num_retries=DRIVE_RETRIES)
+    except Exception as e:
+        print(f"An error occurred while searching the folder: {e}")
+        return {}
+    file_ids = {}
+    for f in response.get('files', []):
+        # Keep the first match per name, as the per-file search did
+        file_ids.setdefault(f['name'], f['id'])
+    return file_ids
+
+def find_and_download_file(service, file_ids, file_name, work_dir):
+    """Downloads a file found by find_folder_files into `work_dir`, streaming it straight to disk."""
+    file_id = file_ids.get(file_name)
+    if not file_id:
+        print(f"WARNING: File '{file_name}' not found in the specified folder.")
+        return None, None  # Return None for both path and file ID
+
+    print(f"Found '{file_name}' with ID: {file_id}. Downloading...")
+    local_path = os.path.join(work_dir, file_name)
+    try:
         request = service.files().get_media(fileId=file_id)
-        # Use io.BytesIO to handle the downloaded content in memory
-        file_content = io.BytesIO()
-        downloader = MediaIoBaseDownload(file_content, request)
-        
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
-            if status:
-                print(f"Download {int(status.progress() * 100)}%.")
-        
-        # Reset the buffer's position to the beginning before reading
-        file_content.seek(0)
+        # Write each chunk to disk as it arrives instead of holding the whole file in memory
+        with open(local_path, 'wb') as file_handle:
+            downloader = MediaIoBaseDownload(file_handle, request)
+
+            done = False
+            while not done:
+                # A retried chunk resumes from the last byte received
+                status, done = downloader.next_chunk(num_retries=DRIVE_RETRIES)
+                if status:
+                    print(f"Download {int(status.progress() * 100)}%.")
+
         print("Download complete.")
-        return file_content, file_id  # Return the in-memory content and the file's ID
+        return local_path, file_id  # Return the local path and the file's ID
 
     except Exception as e:
         print(f"An error occurred while downloading '{file_name}': {e}")
         return None, None
 
-def upload_file_to_drive(service, folder_id, data_to_upload, file_name, mime_type, existing_file_id=None):
-    """Uploads or updates a file in Google Drive."""
+def download_file_in_thread(creds, file_ids, file_name, work_dir):
+    """Runs find_and_download_file on a Drive client owned by the calling thread."""
+    return find_and_download_file(build_drive_service(creds), file_ids, file_name, work_dir)
+
+def upload_file_to_drive(service, folder_id, local_path, file_name, mime_type, existing_file_id=None):
+    """Uploads or updates a file in Google Drive from a local file."""
     print(f"Uploading '{file_name}' to Google Drive...")
-    
-    # Write data to a temporary local file to provide a valid path to MediaFileUpload.
-    local_temp_path = f"temp_{file_name}"
-    with open(local_temp_path, 'w', encoding='utf-8') as f:
-        f.write(data_to_upload)
 
     try:
-        # Initialize MediaFileUpload with the path to the temporary file.
-        media = MediaFileUpload(local_temp_path, mimetype=mime_type, resumable=True)
+        resumable = os.path.getsize(local_path) > SIMPLE_UPLOAD_LIMIT
+        media = MediaFileUpload(local_path, mimetype=mime_type, chunksize=UPLOAD_CHUNK_SIZE, resumable=resumable)
         file_metadata = {'name': file_name}
 
         if existing_file_id:
             # Update the existing file
             print(f"Updating existing file with ID: {existing_file_id}")
-            file = service.files().update(fileId=existing_file_id, body=file_metadata, media_body=media, fields='id').execute()
+            file = service.files().update(fileId=existing_file_id, body=file_metadata, media_body=media, fields='id').execute(num_retries=DRIVE_RETRIES)
         else:
             # Create a new file in the specified folder
             print("Creating new file...")
             file_metadata['parents'] = [folder_id]
-            file = service.files().create(body=file_metadata, media_body=media, fields='id').execute()
+            file = service.files().create(body=file_metadata, media_body=media, fields='id').execute(num_retries=DRIVE_RETRIES)
         
         print(f"Upload successful. New File ID: {file.get('id')}")
     except Exception as e:
         print(f"An error occurred during upload: {e}")
-    finally:
-        # Clean up the local temporary file after upload attempt.
-        if os.path.exists(local_temp_path):
-            os.remove(local_temp_path)
 
 
-def process_int_order(row):
-    """Calculates the value for the 'Int_order' column."""
-    # Ensure input is a string
-    order_num_str = str(row['Hybris Order Number'])
-    
-    # Clean the string robustly: remove quotes (single and double), equals signs, and leading/trailing whitespace
-    cleaned_str = order_num_str.replace('"', '').replace("'", "").replace("=", "").strip()
-    
-    # Check length and process
-    length = len(cleaned_str)
-    try:
-        # If length is 8 or 10, convert to integer
-        if length == 8 or length == 10:
-            return int(cleaned_str)
-        # If length is 16, return as text
-        elif length == 16:
-            return cleaned_str
-        else:
-            # For any other length, ignore by placing 0
-            return 0
-    except (ValueError, TypeError):
-        # Handle cases where conversion to int fails even after cleaning
-        return 0
+def process_int_order(order_text):
+    """Calculates the 'Int_order' column (as text) from the Hybris order numbers already cast to str."""
+    # Clean robustly: remove quotes (single and double), equals signs, and leading/trailing whitespace
+    cleaned = order_text.str.replace(r'["\'=]', '', regex=True).str.strip()
+    length = cleaned.str.len()
+
+    # Length 8 or 10 holding an integer literal is converted to an integer; 16 is kept as text;
+    # anything else (or a failed conversion) becomes 0
+    is_int = (length.isin([8, 10]) & cleaned.str.fullmatch(r'[+-]?[0-9]+(?:_[0-9]+)*').fillna(False)).to_numpy(dtype=bool)
+    is_text = length.isin([16]).to_numpy(dtype=bool)
+
+    int_order = np.full(len(cleaned), '0', dtype=object)
+    int_order[is_int] = pd.to_numeric(cleaned[is_int].str.replace('_', '', regex=False)).astype('int64').astype(str).to_numpy()
+    int_order[is_text] = cleaned[is_text].to_numpy()
+    return pd.Series(int_order, index=order_text.index)
 
 def main():
     """Main function to run the entire data processing pipeline."""
-    drive_service = setup_drive_service()
+    drive_service, creds = setup_drive_service()
     if not drive_service:
         return
 
-    # Download source files from Google Drive
-    print("\n--- Downloading Source Files ---")
-    capacity_content, _ = find_and_download_file(drive_service, DRIVE_FOLDER_ID, DRIVE_FILENAMES["capacity_dump"])
-    merged_breach_content, _ = find_and_download_file(drive_service, DRIVE_FOLDER_ID, DRIVE_FILENAMES["merged_breach"])
+    # Downloads land in a scratch directory that is removed once the run finishes;
+    # the pool is shut down (waiting for any download still running) before that happens
+    with tempfile.TemporaryDirectory() as work_dir, ThreadPoolExecutor(max_workers=len(DRIVE_FILENAMES)) as executor:
+        process_vd_files(drive_service, creds, executor, work_dir)
 
-    if not capacity_content or not merged_breach_content:
+def process_vd_files(drive_service, creds, executor, work_dir):
+    """Downloads the source files into `work_dir`, rebuilds VD_raw_file.txt and uploads it."""
+    # Download source files from Google Drive; all three downloads run at once,
+    # including VD_raw_file.txt, which is only needed after processing
+    print("\n--- Downloading Source Files ---")
+    file_ids = find_folder_files(drive_service, DRIVE_FOLDER_ID, DRIVE_FILENAMES.values())
+    downloads = {
+        key: executor.submit(download_file_in_thread, creds, file_ids, file_name, work_dir)
+        for key, file_name in DRIVE_FILENAMES.items()
+    }
+    capacity_path, _ = downloads["capacity_dump"].result()
+    merged_breach_path, _ = downloads["merged_breach"].result()
+
+    if not capacity_path or not merged_breach_path:
         print("ERROR: Could not download one or more essential source files. Exiting.")
         return
 
-    # Load data into pandas from in-memory content
+    # Load data into pandas from the downloaded files
     print("\n--- Loading data into pandas DataFrames ---")
-    capacity_df = pd.read_csv(capacity_content, low_memory=False)
-    merged_breach_df = pd.read_csv(merged_breach_content, low_memory=False)
+    capacity_df = pd.read_csv(capacity_path, low_memory=False)
+    # Only the two lookup columns of the breach report are used, so only those are parsed
+    breach_lookup = pd.read_csv(merged_breach_path, usecols=['Order_ID', 'Int_Delivery_Date'], low_memory=False)
 
     # --- Data Processing ---
     print("\n--- Starting data processing on Capacity_dump.csv ---")
-    capacity_df['Length'] = capacity_df['Hybris Order Number'].astype(str).str.len()
-    capacity_df['Int_order'] = capacity_df.apply(process_int_order, axis=1)
-    
-    breach_lookup = merged_breach_df[['Order_ID', 'Int_Delivery_Date']].copy()
+    # Stringify the order numbers once for both the Length and Int_order columns
+    order_text = capacity_df['Hybris Order Number'].astype(str)
+    capacity_df['Length'] = order_text.str.len()
+    capacity_df['Int_order'] = process_int_order(order_text)
 
     # Clean the 'Order_ID' in the breach report
     breach_lookup['Order_ID'] = breach_lookup['Order_ID'].astype(str).str.replace('"', '').str.replace("'", "").str.replace("=", "").str.strip()
 
-    # Ensure both merge keys are strings (object type) to allow merging mixed types (int and str).
-    capacity_df['Int_order'] = capacity_df['Int_order'].astype(str)
+    # Ensure both merge keys are strings (object type); Int_order is already text.
     breach_lookup['Order_ID'] = breach_lookup['Order_ID'].astype(str)
 
     # Now the merge can be performed safely on string columns.
@@ -187,26 +197,27 @@ def main():
     
     capacity_df.rename(columns={'Int_Delivery_Date': 'Merged_match'}, inplace=True)
     capacity_df.drop('Order_ID', axis=1, inplace=True, errors='ignore')
-    capacity_df['Int_delivery_date'] = capacity_df['Delivery Success Timestamp'].astype(str).str[:11].replace('nan', np.nan)
+    delivery_ts = capacity_df['Delivery Success Timestamp']
+    # Blank timestamps stay missing through a mask rather than a second pass matching the 'nan' text
+    capacity_df['Int_delivery_date'] = delivery_ts.astype(str).str.slice(0, 11).where(delivery_ts.notna())
     capacity_df['Final Delivery date'] = capacity_df['Int_delivery_date'].fillna(capacity_df['Merged_match'])
     print("--- Processing complete. ---\n")
 
-    # Filter for rows with a valid final delivery date
-    valid_dates_df = capacity_df.dropna(subset=['Final Delivery date'])
-    valid_dates_df = valid_dates_df[pd.to_datetime(valid_dates_df['Final Delivery date'], errors='coerce').notna()]
+    # Filter for rows with a valid final delivery date (blanks parse to NaT, so one parse covers both checks)
+    valid_dates_df = capacity_df[pd.to_datetime(capacity_df['Final Delivery date'], errors='coerce').notna()]
     print(f"Found {len(valid_dates_df)} new rows with valid delivery dates.")
 
     # Handle duplicates by downloading and merging with the existing VD_raw_file.txt
     print("\n--- Handling duplicates with existing VD_raw_file.txt ---")
-    vd_raw_content, vd_raw_file_id = find_and_download_file(drive_service, DRIVE_FOLDER_ID, DRIVE_FILENAMES["vd_raw_file"])
+    vd_raw_path, vd_raw_file_id = downloads["vd_raw_file"].result()
     
     # Define the master list of columns from the newly processed data.
     # This will be the standard for the final output file.
     master_columns = valid_dates_df.columns.tolist()
 
-    if vd_raw_content and vd_raw_content.getbuffer().nbytes > 0:
+    if vd_raw_path and os.path.getsize(vd_raw_path) > 0:
         print("Reading existing data to handle duplicates.")
-        existing_df = pd.read_csv(vd_raw_content, sep='\t', low_memory=False)
+        existing_df = pd.read_csv(vd_raw_path, sep='\t', low_memory=False)
         
         # Reindex the existing data to match the column order and set of the new data.
         # This adds any new columns (like Length, Int_order) as NaN and drops any obsolete ones.
@@ -218,21 +229,27 @@ def main():
         combined_df = valid_dates_df
 
     # FIX: Drop duplicates only if the entire row is identical.
-    final_df = combined_df.drop_duplicates(keep='last')
+    # Rows whose order/date pair is unique cannot be whole-row duplicates, so only the
+    # rows sharing a pair are hashed across every column.
+    candidates = combined_df.duplicated(subset=['Int_order', 'Final Delivery date'], keep=False).to_numpy()
+    keep = ~candidates
+    keep[candidates] = ~combined_df.loc[candidates].duplicated(keep='last').to_numpy()
+    final_df = combined_df.loc[keep]
     
     # Ensure the final DataFrame strictly follows the master column order before saving to prevent jumbling.
     final_df = final_df[master_columns]
     
     print(f"Combined data has {len(final_df)} unique rows after deduplication.")
 
-    # Convert final DataFrame to a string to be uploaded
-    final_data_string = final_df.to_csv(sep='\t', index=False)
+    # Write the final DataFrame straight to a file in the scratch directory for upload
+    upload_path = os.path.join(work_dir, f"upload_{DRIVE_FILENAMES['vd_raw_file']}")
+    final_df.to_csv(upload_path, sep='\t', index=False)
 
     # Upload the processed data back to Google Drive
     upload_file_to_drive(
         service=drive_service,
         folder_id=DRIVE_FOLDER_ID,
-        data_to_upload=final_data_string,
+        local_path=upload_path,
         file_name=DRIVE_FILENAMES["vd_raw_file"],
         mime_type='text/plain',
         existing_file_id=vd_raw_file_id
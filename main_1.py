@@ -5,9 +5,12 @@ import json
 import gspread
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pacsv
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload, MediaFileUpload
+from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload, MediaFileUpload
+from concurrent.futures import ThreadPoolExecutor
 import io
 
 # --- 1. USER CONFIGURATION: You must edit these values ---
@@ -23,54 +26,81 @@ GSHEET_URL = 'https://docs.google.com/spreadsheets/d/1dgmZmhcmJrSd2QzjyzGtk37w3d
 # Define the scopes for the APIs (permissions).
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
 
+# Capacity dump columns that are always parsed as text, so pincodes keep their leading zeros and suffixes.
+CAPACITY_TEXT_COLUMNS = ['ShipToPincode']
+
+# Uploads up to this size go up in one request; larger ones use a resumable session in big chunks.
+SIMPLE_UPLOAD_LIMIT = 5 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 16 * 1024 * 1024
+
+# Powers of ten used to shift store codes left of a pincode's digits.
+POW10 = 10 ** np.arange(1, 19, dtype=np.int64)
+
 # --- Helper Functions for Google Drive & Sheets ---
 
-def get_file_id_by_name(service, file_name, folder_id):
-    """Finds a file's ID by its name within a specific folder."""
-    print(f"Searching for file '{file_name}'...", end='', flush=True)
-    query = f"name = '{file_name}' and '{folder_id}' in parents and trashed = false"
-    response = service.files().list(q=query, spaces='drive', fields='files(id, name)').execute()
-    files = response.get('files', [])
-    if not files:
-        print(" ❌ Not found.")
-        return None
-    else:
-        file_id = files[0].get('id')
-        print(f" ✅ Found")
-        return file_id
+def list_folder_files(service, folder_id):
+    """Lists a folder once and returns a {name: id} map, so every later lookup is a dict hit instead of a search."""
+    query = f"'{folder_id}' in parents and trashed = false"
+    folder_files, page_token = {}, None
+    while True:
+        response = service.files().list(
+            q=query, spaces='drive', fields='nextPageToken, files(id, name)', pageSize=1000, pageToken=page_token
+        ).execute()
+        for f in response.get('files', []):
+            folder_files.setdefault(f['name'], f['id'])
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return folder_files
 
 def download_file_from_drive(service, file_id, local_filename):
     """Downloads a file from Google Drive."""
     print(f"Downloading '{os.path.basename(local_filename)}'...", end='', flush=True)
     request = service.files().get_media(fileId=file_id)
-    fh = io.BytesIO()
-    downloader = MediaIoBaseDownload(fh, request)
-    done = False
-    while not done:
-        status, done = downloader.next_chunk()
-    fh.seek(0)
-    with open(local_filename, 'wb') as f:
-        f.write(fh.read())
+    # Stream straight into the local file rather than holding the whole download in memory first
+    with open(local_filename, 'wb') as fh:
+        downloader = MediaIoBaseDownload(fh, request)
+        done = False
+        while not done:
+            status, done = downloader.next_chunk()
     print(" ✅")
 
-def upload_file_to_drive(service, local_path, folder_id):
-    """Uploads a file to a specific Google Drive folder, overwriting if it exists."""
-    if not os.path.exists(local_path):
-        print(f"ℹ️ Skipped uploading '{os.path.basename(local_path)}' as it was not generated.")
-        return
+def fetch_input_file(creds, file_id, local_filename):
+    """Downloads one input file on its own Drive client (API clients are not thread-safe)."""
+    service = build('drive', 'v3', credentials=creds, static_discovery=True, cache_discovery=False)
+    download_file_from_drive(service, file_id, local_filename)
 
-    file_metadata = {'name': os.path.basename(local_path), 'parents': [folder_id]}
-    media = MediaFileUpload(local_path, resumable=True)
-    print(f"Uploading '{os.path.basename(local_path)}' to Drive...", end='', flush=True)
+def upload_media_to_drive(service, media, file_name, folder_id, folder_files):
+    """Uploads a media body to a specific Google Drive folder, overwriting if it exists in `folder_files` ({name: id})."""
+    file_metadata = {'name': file_name, 'parents': [folder_id]}
+    print(f"Uploading '{file_name}' to Drive...", end='', flush=True)
 
     # Check if file already exists to overwrite it.
-    existing_file_id = get_file_id_by_name(service, os.path.basename(local_path), folder_id)
+    existing_file_id = folder_files.get(file_name)
     if existing_file_id:
         service.files().update(fileId=existing_file_id, media_body=media).execute()
     else:
-        service.files().create(body=file_metadata, media_body=media, fields='id').execute()
+        created = service.files().create(body=file_metadata, media_body=media, fields='id').execute()
+        folder_files[file_name] = created['id']
     print(" ✅")
 
+def upload_file_to_drive(service, local_path, folder_id, folder_files):
+    """Uploads a local file to a specific Google Drive folder, overwriting if it exists."""
+    if not os.path.exists(local_path):
+        print(f"ℹ️ Skipped uploading '{os.path.basename(local_path)}' as it was not generated.")
+        return
+    resumable = os.path.getsize(local_path) > SIMPLE_UPLOAD_LIMIT
+    media = MediaFileUpload(local_path, chunksize=UPLOAD_CHUNK_SIZE, resumable=resumable)
+    upload_media_to_drive(service, media, os.path.basename(local_path), folder_id, folder_files)
+
+def upload_csv_to_drive(service, df, file_name, folder_id, folder_files):
+    """Serialises a DataFrame as CSV straight into the upload buffer, with no local file in between."""
+    buffer = io.BytesIO()
+    df.to_csv(buffer, index=False, encoding='utf-8')
+    buffer.seek(0)
+    resumable = buffer.getbuffer().nbytes > SIMPLE_UPLOAD_LIMIT
+    media = MediaIoBaseUpload(buffer, mimetype='text/csv', chunksize=UPLOAD_CHUNK_SIZE, resumable=resumable)
+    upload_media_to_drive(service, media, file_name, folder_id, folder_files)
+
 def export_df_to_gsheet(spreadsheet, df_to_export, sheet_name):
     """Exports a Pandas DataFrame to a specific worksheet in a Google Sheet."""
     if df_to_export is None:
@@ -97,6 +127,49 @@ def export_df_to_gsheet(spreadsheet, df_to_export, sheet_name):
         print(f"\n❌ An error occurred during the export to '{sheet_name}': {e}")
 
 
+# --- Helper Functions for Data Processing ---
+
+def read_csv_fast(path, text_columns=None):
+    """Parses a CSV with pyarrow's multithreaded reader, falling back to the pandas C parser."""
+    column_types = {c: pa.string() for c in text_columns or []}
+    try:
+        # Columns pyarrow would turn into dates are kept as text, exactly like pd.read_csv does;
+        # the types are inferred from the first block, so this only reads a small prefix
+        with pacsv.open_csv(path, convert_options=pacsv.ConvertOptions(column_types=column_types)) as reader:
+            column_types.update({f.name: pa.string() for f in reader.schema if pa.types.is_temporal(f.type)})
+        table = pacsv.read_csv(
+            path, convert_options=pacsv.ConvertOptions(strings_can_be_null=True, column_types=column_types)
+        )
+    except pa.ArrowInvalid as e:
+        # pyarrow rejects some quoting edge cases the C parser tolerates
+        print(f"⚠️ pyarrow could not parse {path} ({e}), using the default parser.")
+        return pd.read_csv(path, low_memory=False)
+    if any(pa.types.is_binary(f.type) for f in table.schema):
+        # pyarrow falls back to raw bytes on bad text; let pandas raise its usual decode error
+        return pd.read_csv(path, low_memory=False)
+    return table.to_pandas()
+
+def to_int64(series):
+    """Parses an ID column to an int64 array in one pass, with blanks and junk as 0."""
+    values = pd.to_numeric(series, errors='coerce').to_numpy()
+    if values.dtype.kind in 'iu':
+        # Every entry parsed as a whole number; no float round trip needed
+        return values.astype(np.int64)
+    return np.nan_to_num(values.astype(np.float64), nan=0.0).astype(np.int64)
+
+def concat_key(left, right):
+    """Integer equivalent of str(left) + str(right), matching the store+pincode 'Concat' keys in Pincode_distance.xlsx."""
+    right = right.to_numpy(dtype=np.int64)
+    digits = np.searchsorted(POW10, right, side='right') + 1
+    return pd.Series(left.to_numpy(dtype=np.int64) * (10 ** digits) + right, index=left.index)
+
+def lookup_series(lookup_df, key_col, value_col, sheet_name):
+    """Builds a key -> value Series from a lookup sheet, warning when a key repeats (the first row wins)."""
+    duplicated = lookup_df[key_col].duplicated()
+    if duplicated.any():
+        print(f"⚠️ {sheet_name}: {int(duplicated.sum())} duplicate '{key_col}' rows ignored.")
+    return lookup_df.loc[~duplicated].set_index(key_col)[value_col]
+
 def main():
     """Main function to run the entire automation process."""
     print("--- 1. Authenticating ---")
@@ -107,7 +180,7 @@ def main():
     creds_info = json.loads(creds_json_str)
     creds = Credentials.from_service_account_info(creds_info, scopes=SCOPES)
 
-    drive_service = build('drive', 'v3', credentials=creds)
+    drive_service = build('drive', 'v3', credentials=creds, static_discovery=True, cache_discovery=False)
     sheets_service = gspread.authorize(creds)
     print("✅ Authentication successful.")
     print("-" * 30)
@@ -121,11 +194,21 @@ def main():
         'Xd_store.xlsx', 'Free_delivery_list.xlsx'
     ]
 
+    # One listing of the folder serves the input lookups here and the overwrite checks on upload
+    folder_files = list_folder_files(drive_service, INPUT_OUTPUT_FOLDER_ID)
     for filename in input_filenames:
-        file_id = get_file_id_by_name(drive_service, filename, INPUT_OUTPUT_FOLDER_ID)
-        if not file_id:
+        if filename not in folder_files:
             raise FileNotFoundError(f"'{filename}' could not be found in the specified Drive folder. Please check the name and location.")
-        download_file_from_drive(drive_service, file_id, os.path.join(local_data_path, filename))
+    print(f"✅ Found all {len(input_filenames)} input files.")
+
+    # The downloads are independent, so they run side by side; result() re-raises the first failure in list order
+    with ThreadPoolExecutor(max_workers=len(input_filenames)) as executor:
+        futures = [
+            executor.submit(fetch_input_file, creds, folder_files[filename], os.path.join(local_data_path, filename))
+            for filename in input_filenames
+        ]
+        for future in futures:
+            future.result()
     print("-" * 30)
 
     print("--- 3. Loading and Processing Data ---")
@@ -135,37 +218,41 @@ def main():
     xd_store_file = os.path.join(local_data_path, 'Xd_store.xlsx')
     free_delivery_file = os.path.join(local_data_path, 'Free_delivery_list.xlsx')
 
-    df = pd.read_csv(main_file, low_memory=False)
-    ct_master_df = pd.read_excel(ct_master_file)
-    pincode_df = pd.read_excel(pincode_file)
-    xd_store_df = pd.read_excel(xd_store_file)
-    free_delivery_df = pd.read_excel(free_delivery_file)
+    df = read_csv_fast(main_file, CAPACITY_TEXT_COLUMNS)
+    # The lookup workbooks go through the Rust calamine reader, loading only the columns used
+    ct_master_df = pd.read_excel(ct_master_file, engine='calamine', usecols=['Store_Code', 'Store_Name_PBI'])
+    pincode_df = pd.read_excel(pincode_file, engine='calamine', usecols=['Concat', 'Distance'])
+    xd_store_df = pd.read_excel(xd_store_file, engine='calamine', usecols=['Pincode', 'Cross_dock_name'])
+    free_delivery_df = pd.read_excel(free_delivery_file, engine='calamine', usecols=['Membership Nbr'])
     print("✅ All input files loaded into DataFrames.")
     print("-" * 30)
 
     # --- DATA PROCESSING AND REPORT GENERATION STARTS HERE ---
 
     print("--- Processing and Enriching Data ---")
-    df['Int_pincode'] = pd.to_numeric(df['ShipToPincode'].astype(str).str.extract(r'(\d+)', expand=False), errors='coerce').fillna(0).astype(int)
-    df['Int_article'] = pd.to_numeric(df['Item'], errors='coerce').fillna(0).astype(int)
-    df['Int_storecode'] = pd.to_numeric(df['Store Code1'].astype(str).str.extract(r'(\d+)', expand=False), errors='coerce').fillna(0).astype(int)
-    df['Key'] = pd.to_numeric(df['Int_storecode'].astype(str) + df['Int_pincode'].astype(str), errors='coerce').fillna(0).astype(int)
+    df['Int_pincode'] = to_int64(df['ShipToPincode'].astype(str).str.extract(r'(\d+)', expand=False))
+    df['Int_article'] = to_int64(df['Item'])
+    df['Int_storecode'] = to_int64(df['Store Code1'].astype(str).str.extract(r'(\d+)', expand=False))
+    df['Key'] = concat_key(df['Int_storecode'], df['Int_pincode'])
     df['Int_order_date'] = pd.to_datetime(df['Order Date IST'].astype(str).str.split(' ').str[0], errors='coerce').dt.strftime('%m/%d/%Y')
     df['Int_delivery_date'] = pd.to_datetime(df['Delivery Success Timestamp'].astype(str).str.split(' ').str[0], errors='coerce').dt.strftime('%Y-%m-%d')
     df['Int_LR_date'] = pd.to_datetime(df['LR Date Time'], errors='coerce').dt.strftime('%Y-%m-%d')
-    df['UPI ID'] = pd.to_numeric(df['upiTransactionId'].astype(str).str.extract(r'(\d+)', expand=False), errors='coerce').fillna(0).astype('int64')
-    df['M track'] = pd.to_numeric(df['Member Id'].astype(str).str.extract(r'(\d+)', expand=False).str.slice(-8), errors='coerce').fillna(0).astype(int)
+    df['UPI ID'] = to_int64(df['upiTransactionId'].astype(str).str.extract(r'(\d+)', expand=False))
+    df['M track'] = to_int64(df['Member Id'].astype(str).str.extract(r'(\d+)', expand=False).str.slice(-8))
     df['Gross Weight'] = pd.to_numeric(df['Gross Weight'], errors='coerce')
     df['Item Gross Weight'] = pd.to_numeric(df['Item Gross Weight'], errors='coerce')
     df['Net_Amount'] = pd.to_numeric(df['Net_Amount'], errors='coerce')
     df['Invoice Value'] = pd.to_numeric(df['Invoice Value'], errors='coerce')
     df['Item Freight'] = pd.to_numeric(df['Item Freight'], errors='coerce')
 
-    df = pd.merge(df, ct_master_df[['Store_Code', 'Store_Name_PBI']], left_on='Int_storecode', right_on='Store_Code', how='left').rename(columns={'Store_Name_PBI': 'Store_Name'}).drop(columns=['Store_Code'])
-    df = pd.merge(df, pincode_df[['Concat', 'Distance']], left_on='Key', right_on='Concat', how='left').rename(columns={'Distance': 'distance'}).drop(columns=['Concat'])
-    df = pd.merge(df, xd_store_df[['Pincode', 'Cross_dock_name']], left_on='Int_pincode', right_on='Pincode', how='left').rename(columns={'Cross_dock_name': 'X_doc'}).drop(columns=['Pincode'])
-    free_delivery_df['match_indicator'] = 'Yes'
-    df = pd.merge(df, free_delivery_df[['Membership Nbr', 'match_indicator']], left_on='M track', right_on='Membership Nbr', how='left').rename(columns={'match_indicator': 'Cheque'}).fillna({'Cheque': 'No'}).drop(columns=['Membership Nbr'])
+    # Lookups are reindexed straight onto the main frame as plain arrays; each lookup keeps the first row per key.
+    store_names = lookup_series(ct_master_df, 'Store_Code', 'Store_Name_PBI', 'CT_Master_Store_Code.xlsx')
+    distances = lookup_series(pincode_df, 'Concat', 'Distance', 'Pincode_distance.xlsx')
+    cross_docks = lookup_series(xd_store_df, 'Pincode', 'Cross_dock_name', 'Xd_store.xlsx')
+    df['Store_Name'] = store_names.reindex(df['Int_storecode'].to_numpy()).to_numpy()
+    df['distance'] = distances.reindex(df['Key'].to_numpy()).to_numpy()
+    df['X_doc'] = cross_docks.reindex(df['Int_pincode'].to_numpy()).to_numpy()
+    df['Cheque'] = np.where(df['M track'].isin(free_delivery_df['Membership Nbr']), 'Yes', 'No')
 
     df['Free_Delivery'] = np.select([(df['Mode of Fullfillment'] == 'DSD'), (df['Mode of Fullfillment'].isin(['ISP', 'Walkin'])) & (df['Cheque'] == 'Yes')], ['Yes', 'Yes'], default='No')
     df['Considered'] = np.select([(df['Mode of Fullfillment'].isin(['DSD','ISP'])) & (df['Free_Delivery'] == 'Yes')], ['Yes'], default='No')
@@ -367,9 +454,7 @@ def main():
     # --- 4. Saving & Uploading Output Files ---
     print("--- Saving reports locally before uploading to Drive ---")
 
-    # Define local output file paths
-    output_file_path = os.path.join(local_data_path, 'Capacity_dump_updated.csv')
-    summary_output_path = os.path.join(local_data_path, 'Store_Summary_Report.csv')
+    # Define local output file paths (the two CSVs are uploaded straight from memory below)
     order_attainment_path = os.path.join(local_data_path, 'Order_attainment_summary_report.xlsx')
     capacity_summary_path = os.path.join(local_data_path, 'Capacity_Summary_Report.xlsx')
     upi_summary_path = os.path.join(local_data_path, 'UPI_Summary_Report.xlsx')
@@ -379,9 +464,6 @@ def main():
 
     # Save files locally
     df.drop(columns=['Int_LR_date_dt'], inplace=True, errors='ignore')
-    df.to_csv(output_file_path, index=False)
-
-    summary_df.to_csv(summary_output_path, index=False)
 
     if overall_pivot is not None:
         with pd.ExcelWriter(order_attainment_path, engine='openpyxl') as writer:
@@ -406,14 +488,17 @@ def main():
         dispatch_summary_final.to_excel(dispatch_report_path, index=False, sheet_name='Dispatch_summary')
 
     # Upload all generated files to Google Drive
+    upload_csv_to_drive(drive_service, df, 'Capacity_dump_updated.csv', INPUT_OUTPUT_FOLDER_ID, folder_files)
+    upload_csv_to_drive(drive_service, summary_df, 'Store_Summary_Report.csv', INPUT_OUTPUT_FOLDER_ID, folder_files)
+
     files_to_upload = [
-        output_file_path, summary_output_path, order_attainment_path, 
+        order_attainment_path, 
         capacity_summary_path, upi_summary_path, non_adherence_report_path, 
         cross_dock_report_path, dispatch_report_path
     ]
 
     for path in files_to_upload:
-        upload_file_to_drive(drive_service, path, INPUT_OUTPUT_FOLDER_ID)
+        upload_file_to_drive(drive_service, path, INPUT_OUTPUT_FOLDER_ID, folder_files)
     print("-" * 30)
 
     # --- 5. Exporting Reports to Google Sheets ---